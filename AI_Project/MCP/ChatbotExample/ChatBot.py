@@ -1,8 +1,9 @@
 from typing import List,Dict,Any
 
-from anthropic import Anthropic  # Assuming Anthropic is a class that handles the chat logic
+from llm_client import get_llm_client, stream_message
 
 from mcp_client import StdioServerParameters,stdio_client,ClientSession
+from tool_dispatch import ToolDispatcher
 
 
 class ChatBot:
@@ -10,56 +11,50 @@ class ChatBot:
         self.name = "ChatBot P1"
         self.version = "1.0"
         self.greeting = "Hello! I am ChatBot P1. How can I assist you today?"
-        self.client = Anthropic()  # Assuming Anthropics is a class that handles the chat logic
+        self.client = get_llm_client()  # shared AsyncAnthropic client, awaited so the event loop keeps running
         self.available_tools: List[Dict] = []
         self.sessions:ClientSession = None  # This could be used to manage multiple user sessions if needed
+        self.tool_dispatcher = ToolDispatcher(max_in_flight=4)  # runs the tools of one response concurrently
 
 
     # 这个函数代表一次查询过程
+    # 回复以流的形式打印，tool_use块一接收完整就开始调用工具，每轮打印首个token的耗时
     async def process_query(self, user_input):
         messages = [{
             "role": "user",
             "content": user_input
         }]
-        response = self.client.messages.create(
-            model="claude-3-7-sonnet-20250219",
-            messages=messages,
-            tools=self.available_tools,  # Assuming no tools are used in this simple version
-            max_tokens=2024
-        )
 
-        _query = True
-        while _query:
-            assistant_content = []
-            user_messages_content = []
-            for content in response.content:
-                if content.type == "text":
-                    assistant_content.append(content.text)
-                    if len(response.content) == 1:
-                        _query = False
-                elif content.type == "tool_use":
-                    assistant_content.append(content)
-                    tool_id = content.id
-                    tool_name = content.name
-                    tool_args = content.input
-                    # Here you would execute the tool and get the result
-                    result = await self.sessions.call_tool(tool_name,arguments=tool_args)
-                    user_messages_content.append({"type": "tool_result", "tool_use_id": tool_id, "content": result})
+        while True:
+            tool_uses = []
+            tool_tasks = []
+
+            def start_tool(tool_use):
+                # Here you would execute the tool, it starts while the rest of the response still streams
+                tool_uses.append(tool_use)
+                tool_tasks.append(self.tool_dispatcher.start(tool_use, self.sessions))
+
+            response, first_token = await stream_message(
+                self.client,
+                on_tool_use=start_tool,
+                model="claude-3-7-sonnet-20250219",
+                messages=messages,
+                tools=self.available_tools,  # Assuming no tools are used in this simple version
+                max_tokens=2024
+            )
+            if first_token is not None:
+                print(f"[time to first token: {first_token:.2f}s]")
+            if not tool_uses:
+                break
 
             messages.append({
                 "role": "assistant",
-                "content": assistant_content,
+                "content": response.content,
             })
             messages.append({
                 "role": "user",
-                "content": user_messages_content,
+                "content": await self.tool_dispatcher.collect(tool_uses, tool_tasks),
             })
-            response = self.client.messages.create(
-                model="claude-3-7-sonnet-20250219",
-                messages=messages,
-                tools=self.available_tools,  # Assuming no tools are used in this simple version
-                max_tokens=2024
-            )
 
     async def chat_loop(self):
         print(self.greeting)
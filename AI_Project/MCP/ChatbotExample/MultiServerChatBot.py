@@ -1,11 +1,15 @@
+import asyncio
 import json
 from contextlib import AsyncExitStack
 from pyexpat.errors import messages
 from typing import List, Dict, Any
-from mcp import ClientSession,StdioServerParameters,stdio_client
-from anthropic import Anthropic
+from llm_client import get_llm_client
 from pydantic import BaseModel
 from mcp_client import server_params
+from capability_cache import CapabilityCache
+from server_connections import ServerConnection, ServerPool
+from tool_cache import ToolResultCache
+from tool_dispatch import ToolDispatcher
 
 
 
@@ -21,17 +25,23 @@ class MultiServerChatBot:
         self.version = "1.0"
         self.description = "A chatbot that can interact with multiple servers."
 
-        self.llm = Anthropic()
+        self.llm = get_llm_client()  # shared AsyncAnthropic client, awaited so the event loop keeps running
         self.available_tools:List[ToolDefinition] = []
-        self.sessions_mapping_toolName:Dict[str, ClientSession] = {}  # Store sessions for different servers
+        self.sessions_mapping_toolName:Dict[str, ServerConnection] = {}  # Store server connections, used like their sessions
         self.exit_stack = AsyncExitStack()
+        # runs the tool_use blocks of one response concurrently, at most 4 calls in flight per server,
+        # and answers repeated calls of idempotent tools from the tool result cache
+        self.tool_dispatcher = ToolDispatcher(max_in_flight=4, cache=ToolResultCache())
+        # starts all servers concurrently, late servers are registered when they come up
+        # servers in the capability cache are usable at once, their listings are revalidated in the background
+        self.server_pool = ServerPool(on_ready=self.register_server, cache=CapabilityCache())
 
 
     async def process_query(self, query, server_id):
         messages = [
             {"role": "user", "content": query}
         ]
-        response = self.llm.messages.create(
+        response = await self.llm.messages.create(
             model="claude-3-7-sonnet-20250219",
             messages=messages,
             tools=self.available_tools,
@@ -40,7 +50,7 @@ class MultiServerChatBot:
         process_query_flag = True
         while process_query_flag:
             assistant_content = []
-            user_tools_content = []
+            tool_uses = []
             for content in response.content:
                 if content.type == "text":
                     assistant_content.append(content)
@@ -48,22 +58,12 @@ class MultiServerChatBot:
                         process_query_flag = False
                 elif content.type == "tool_use":
                     assistant_content.append(content)
-                    tool_id = content.id
-                    tool_name = content.name
-                    tool_args = content.input
-
-                    # Get the session for the specific server
-                    session = self.sessions_mapping_toolName.get(tool_name)
-                    if not session:
-                        raise ValueError(f"No session found for tool name: {tool_name}")
-
-                    # Execute the tool and get the result
-                    result = await session.call_tool(tool_name, arguments=tool_args)
-                    user_tools_content.append({
-                        "type": "tool_result",
-                        "tool_use_id": tool_id,
-                        "content": result,
-                    })
+                    tool_uses.append(content)
+            if not tool_uses:
+                break
+
+            # Execute the tools concurrently, each on the session of the server that has it
+            user_tools_content = await self.tool_dispatcher.dispatch(tool_uses, self.sessions_mapping_toolName.get)
 
             messages.append({
                 "role": "assistant",
@@ -73,7 +73,7 @@ class MultiServerChatBot:
                 "role": "user",
                 "content": user_tools_content,
             })
-            response = self.llm.messages.create(
+            response = await self.llm.messages.create(
                 model="claude-3-7-sonnet-20250219",
                 messages=messages,
                 tools=self.available_tools,
@@ -87,56 +87,41 @@ class MultiServerChatBot:
         print(f"{self.name} v{self.version} - {self.description}")
         while True:
             try:
-                query = input("\nQuery: ").strip()
+                # read the input off the event loop so servers can still attach in the background
+                query = (await asyncio.to_thread(input, "\nQuery: ")).strip()
                 if query.lower() == "exit":
                     print("Exiting the chat. Goodbye!")
                     break
 
-                server_id = input("Enter server ID: ").strip()  # Get server ID from user
+                server_id = (await asyncio.to_thread(input, "Enter server ID: ")).strip()  # Get server ID from user
                 await self.process_query(query, server_id)
             except Exception as e:
                 print(f"An error occurred: {e}")
 
-    async def connect_to_single_server(self,server_name:str,server_config:dict) ->None:
-        """connect to a server and store the session"""
-
-        try:
-            server_params = StdioServerParameters(**server_config)
-            stdio_transport = await self.exit_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            reader, writer = stdio_transport
-            session = await self.exit_stack.enter_async_context(
-                ClientSession(reader, writer)
-            )
-            await session.initialize()
-
-            response = await session.list_tools()
-            session.list_prompts()  # Assuming this is needed to initialize prompts
-            tools = response.tools
-            for tool in tools:
-                print("tool.name:", tool.name, type(tool.name))
-                print("tool.description:", tool.description, type(tool.description))
-                print("tool.inputSchema:", tool.inputSchema, type(tool.inputSchema))
-                self.sessions_mapping_toolName[tool.name] = session
-                self.available_tools.append(ToolDefinition(name=tool.name, description=tool.description, input_schema=tool.inputSchema))
-        except Exception as e:
-            print(f"Failed to connect to server {server_name}: {e}")
+    def register_server(self, connection: ServerConnection) -> None:
+        """register the tools of a server, from the capability cache or live, replacing its earlier registration"""
+        mapping = {name: owner for name, owner in self.sessions_mapping_toolName.items() if owner is not connection}
+        available_tools = [tool for tool in self.available_tools if mapping.get(tool.name) is not None]
+        for tool in connection.tools:
+            mapping[tool.name] = connection
+            available_tools.append(ToolDefinition(name=tool.name, description=tool.description, input_schema=tool.inputSchema))
+        self.sessions_mapping_toolName = mapping
+        self.available_tools = available_tools
 
     async def connect_to_servers(self):
-        """connect to all servers defined in server_params"""
+        """connect to all servers defined in server_config.json at once, each bounded by its startup deadline"""
         try:
             with open("server_config.json", "r") as f:
                 data = json.load(f)
             servers = data.get("mcpServers", {})
-            for server_name, server_config in servers.items():
-                await self.connect_to_single_server(server_name, server_config)
+            await self.server_pool.start(servers)
         except Exception as e:
             print(f"Error loading server configuration: {e}")
             raise
 
     async def cleanup(self):
         """cleanly close all resoueces using AsyncExitStack"""
+        await self.server_pool.close()
         await self.exit_stack.aclose()
         print("Cleaned up resources.")
 
@@ -149,5 +134,4 @@ async def main():
         await chatbot.cleanup()
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
\ No newline at end of file
@@ -1,12 +1,17 @@
 import asyncio
+import re
 
-from anthropic import Anthropic
+from llm_client import get_llm_client, stream_message
 from typing import List, Dict, Any
-from mcp import ClientSession, StdioServerParameters, stdio_client
+from mcp import types
 from mcp import Resource
 from contextlib import AsyncExitStack
 import json
 from pydantic import BaseModel,AnyUrl,TypeAdapter,ValidationError
+from capability_cache import CapabilityCache
+from server_connections import ServerConnection, ServerPool
+from tool_cache import ToolResultCache
+from tool_dispatch import ToolDispatcher
 
 
 class ToolDefinition(BaseModel):
@@ -21,13 +26,28 @@ class MultiServerWithResourceAndPromptChatbot(object):
         self.version = "1.0"
         self.description = "A chatbot that can interact with multiple servers, resources, and prompts."
 
-        self.llm = Anthropic()
+        self.llm = get_llm_client()  # shared AsyncAnthropic client, awaited so the event loop keeps running
         self.async_exit_stack = AsyncExitStack()
 
         self.available_tools: List[ToolDefinition] = []
         self.available_prompts = []
-        # dictionary to map tool names and resourceUri to their corresponding sessions
-        self.sessions_mapping_resourceOrToolName: Dict[str, ClientSession] = {}
+        # dictionary to map tool names and resourceUri to their corresponding server connections,
+        # a connection is used like its ClientSession and waits while the server is still starting
+        self.sessions_mapping_resourceOrToolName: Dict[str, ServerConnection] = {}
+        # local copies of resources read with @topic: uri -> {"text": ..., "version": ...}
+        self.resource_cache: Dict[str, Dict[str, Any]] = {}
+        # uris the server promised to send notifications/resources/updated for -> connection of that server
+        self.subscribed_uris: Dict[str, ServerConnection] = {}
+        # connections whose server announced resources.subscribe
+        self.subscribable_sessions = set()
+        # runs the tool_use blocks of one response concurrently, at most 4 calls in flight per server,
+        # and answers repeated calls of idempotent tools from the tool result cache
+        self.tool_dispatcher = ToolDispatcher(max_in_flight=4, cache=ToolResultCache())
+        # starts all servers concurrently, late servers are registered when they come up
+        # servers listed in the capability cache are registered from it at once and spawned on first use,
+        # idle servers are shut down and restarted by the next call routed to them
+        self.server_pool = ServerPool(on_ready=self.register_server, message_handler=self.handle_server_message,
+                                      cache=CapabilityCache(), on_stopped=self.forget_server_state)
 
 
     # 函数小模板
@@ -63,15 +83,91 @@ class MultiServerWithResourceAndPromptChatbot(object):
             return
 
         try:
-            result = await session.read_resource(AnyUrl(resource_uri))
-            if result and result.contents:
+            text = await self.read_resource_cached(session, resource_uri)
+            if text is not None:
                 print(f"\nResource:{resource_uri}\n")
-                print(f"Contents:{result.contents[0].text}")
+                print(f"Contents:{text}")
             else:
                 print("No contents found for the resource.")
         except Exception as e:
             print(f"Error retrieving resource {resource_uri}: {e}")
 
+    """
+    函数名： read_resource_cached
+    功能： 读取资源，优先使用本地缓存
+    输入： session: ServerConnection 资源所在服务器的连接，用法和会话对象一样
+              resource_uri: str 统一资源标识符
+    输出： 资源的文本内容，没有内容时返回None
+    步骤拆解：
+    1.如果本地有缓存，并且已经订阅了该资源，服务器会在资源变化时发送notifications/resources/updated，缓存在收到通知前一直有效，直接返回缓存
+    2.如果本地有缓存但没有订阅（服务器不支持订阅），则读取 papers://{topic}/since/{version}，服务器返回"Not modified"时继续使用缓存
+    3.否则完整读取资源，从内容中的"Version: N"行记下版本号，存入缓存
+    4.服务器支持订阅时订阅该资源，之后只在收到失效通知后才重新读取
+    """
+    async def read_resource_cached(self, session: ServerConnection, resource_uri: str):
+        cached = self.resource_cache.get(resource_uri)
+        if cached is not None:
+            if resource_uri in self.subscribed_uris:
+                return cached["text"]
+            if cached["version"] is not None:
+                result = await session.read_resource(AnyUrl(f"{resource_uri}/since/{cached['version']}"))
+                if result and result.contents and result.contents[0].text.startswith("Not modified"):
+                    return cached["text"]
+
+        result = await session.read_resource(AnyUrl(resource_uri))
+        if not (result and result.contents):
+            return None
+        text = result.contents[0].text
+        version = re.search(r"^Version: (\d+)$", text, re.MULTILINE)
+        # only topic pages carry a version, they are the only reads the conditional path applies to
+        self.resource_cache[resource_uri] = {"text": text, "version": version.group(1) if version else None}
+
+        if session in self.subscribable_sessions and resource_uri not in self.subscribed_uris:
+            await session.subscribe_resource(AnyUrl(resource_uri))
+            self.subscribed_uris[resource_uri] = session
+        return text
+
+    """
+    函数名： handle_server_message
+    功能： 处理服务器主动发来的消息，让资源缓存失效
+    输入： connection: ServerConnection 发消息的服务器连接
+              message: 服务器发来的请求、通知或者异常
+    输出： 无
+    步骤拆解：
+    1.收到 notifications/resources/updated 时，删除该资源的本地缓存，下次读取时重新获取
+    2.收到 notifications/resources/list_changed 时，在后台重新获取该服务器的资源列表；
+      不能在这里直接await请求，因为这个函数运行在会话接收消息的循环里，等待的响应也要经过这个循环
+    """
+    async def handle_server_message(self, connection: ServerConnection, message):
+        if not isinstance(message, types.ServerNotification):
+            return
+        notification = message.root
+        if isinstance(notification, types.ResourceUpdatedNotification):
+            self.resource_cache.pop(str(notification.params.uri), None)
+        elif isinstance(notification, types.ResourceListChangedNotification):
+            asyncio.create_task(self.refresh_resource_list(connection))
+
+    def forget_server_state(self, connection: ServerConnection):
+        """
+        Drops the subscriptions of a server that shut down (idle or crashed), a restarted server does not know them.
+        The cached copies go too, their next read is a full read that subscribes again.
+        """
+        for uri, owner in list(self.subscribed_uris.items()):
+            if owner is connection:
+                del self.subscribed_uris[uri]
+                self.resource_cache.pop(uri, None)
+
+    async def refresh_resource_list(self, session: ServerConnection):
+        """
+        Re-lists the resources of one server after it announced that the list changed.
+        """
+        try:
+            resource_responses = await session.list_resources()
+            for resource in resource_responses.resources:
+                self.sessions_mapping_resourceOrToolName[str(resource.uri)] = session
+        except Exception as e:
+            print(f"Error refreshing resources: {e}")
+
 
     """
     # 函数名： list_prompts
@@ -144,55 +240,48 @@ class MultiServerWithResourceAndPromptChatbot(object):
     步骤拆解：
     主要是两部分信息：一个是用户普通对话，一个是大模型需要对工具进行调用的对话，工具调用可能涉及多轮对话
     工具和资源、提示不同，工具是大模型主动调用的，而资源和提示是用户主动查询的，所以工具的调用需要根据大模型的消息判断，而资源和提示是根据用户的消息进行判断
+    一次回复里的多个tool_use块互不依赖（可能在不同的服务器上），交给 tool_dispatcher 同时调用，
+    每轮的耗时取决于最慢的那个工具而不是所有工具耗时之和；某个工具失败只会让它自己的tool_result带上is_error，结果按tool_use块的原始顺序返回
+    回复以流的形式接收：文本一到就打印出来；tool_use块的参数JSON接收完整时立即开始调用该工具，不用等整条回复结束；每轮打印首个token的耗时
+    幂等的工具（服务器标注了idempotentHint，或配置里cacheTools列出的）相同参数的结果会被缓存，bypass_cache为True时这次查询不读缓存（/nocache 命令）
     """
-    async def process_query(self,query:str):
+    async def process_query(self,query:str, bypass_cache: bool = False):
         messages = [
             {"role": "user", "content": query}
         ]
-        response = self.llm.messages.create(
-            model="claude-3-7-sonnet-20250219",
-            messages=messages,
-            tools=self.available_tools,
-            max_tokens=2024
-        )
-        process_query_flag = True
-        while process_query_flag:
-            assistant_content = []
-            user_tools_content = []
-            for content in response.content:
-                if content.type == "text":
-                    assistant_content.append(content)
-                    if len(response.content) == 1:
-                        process_query_flag = False
-                elif content.type == "tool_use":
-                    assistant_content.append(content)
-                    tool_id = content.id
-                    tool_name = content.name
-                    tool_args = content.input
-
-                    # Get the session for the specific server
-                    session = self.sessions_mapping_resourceOrToolName.get(tool_name)
-                    if not session:
-                        raise ValueError(f"No session found for tool name: {tool_name}")
-
-                    # Execute the tool with the session
-                    result = await session.call_tool(tool_name, tool_args)
-                    user_tools_content.append({"type": "tool_result", "id": tool_id, "result": result})
+        while True:
+            tool_uses = []
+            tool_tasks = []
+
+            def start_tool(tool_use):
+                # Execute the tool with the session of its server as soon as its block is complete
+                tool_uses.append(tool_use)
+                tool_tasks.append(self.tool_dispatcher.start(
+                    tool_use, self.sessions_mapping_resourceOrToolName.get(tool_use.name), bypass_cache
+                ))
+
+            response, first_token = await stream_message(
+                self.llm,
+                on_tool_use=start_tool,
+                model="claude-3-7-sonnet-20250219",
+                messages=messages,
+                tools=self.available_tools,
+                max_tokens=2024
+            )
+            if first_token is not None:
+                print(f"[time to first token: {first_token:.2f}s]")
+            if not tool_uses:
+                break
 
+            user_tools_content = await self.tool_dispatcher.collect(tool_uses, tool_tasks)
             messages.append({
                 "role": "assistant",
-                "content": assistant_content,
+                "content": response.content,
             })
             messages.append({
                 "role": "user",
                 "content": user_tools_content,
             })
-            response = self.llm.messages.create(
-                model="claude-3-7-sonnet-20250219",
-                messages=messages,
-                tools=self.available_tools,
-                max_tokens=2024
-            )
 
 
     """
@@ -207,12 +296,15 @@ class MultiServerWithResourceAndPromptChatbot(object):
     4.如果用户输入的查询内容以"/"开头，则认为是提示查询，解析命令并执行对应的操作。如果用户输入的是"/prompts"，则列出所有可用的提示；
         如果输入的是"/prompt"，需要解析提示名字和参数，用户的输入格式必须为“/prompt prompt_name args1=value1 args2=value2”的格式，
         例如："/prompt generate_search_prompt topic=computer num_papers=3"
+        "/cache"打印工具结果缓存的命中率统计；"/nocache 查询内容"执行这次查询时不使用缓存的工具结果；
+        "/servers"打印每个服务器（包括副本）的状态、正在进行的调用数、启动次数和最近的错误
     5.如果用户输入的查询内容不是资源查询和提示查询，则认为是普通查询，调用 process_query 方法处理查询
     """
     async def chat_loop_new(self):
         while True:
             try:
-                query = input("> Query:").strip()
+                # read the input off the event loop so servers can still attach in the background
+                query = (await asyncio.to_thread(input, "> Query:")).strip()
                 if not query:
                     continue
                 if query.lower() == "quit":
@@ -242,6 +334,12 @@ class MultiServerWithResourceAndPromptChatbot(object):
                                 key, value = arg.split("=",1)
                                 args[key] = value
                         await self.execute_prompt(prompt_name, args)
+                    elif command == "/cache":
+                        print(json.dumps(self.tool_dispatcher.cache.get_stats(), indent=2))
+                    elif command == "/nocache":
+                        await self.process_query(query[len(parts[0]):].strip(), bypass_cache=True)
+                    elif command == "/servers":
+                        print(self.server_pool.status_report())
                     else:
                         print(f"Unknown command: {command}")
                     continue
@@ -253,69 +351,62 @@ class MultiServerWithResourceAndPromptChatbot(object):
         """
         Cleans up resources and closes all sessions.
         """
+        await self.server_pool.close()
         await self.async_exit_stack.aclose()
         print("All sessions closed and resources cleaned up.")
 
 
     """
-    函数名： connect_to_single_server
-    功能： 连接到单个服务器
-    输入： server_name: str 服务器名称
-              server_config: Dict[str, Any] 服务器配置
+    函数名： register_server
+    功能： 登记一个服务器的工具、提示和资源
+    输入： connection: ServerConnection 已经列出工具、提示和资源的服务器连接
     输出： 无
     步骤拆解：
-         1.根据服务器配置信息，初始化标准输入输出连接的客户端和session会话对象，并使用AsyncExitStack来管理资源的清理
-         2.拿到session对象并初始化完成后，分别获取该mcp服务上可用的工具、提示和资源，并分别进行存储
-         3.对于工具，资源和提示，都将其的名称作为key，session对象作为value存储在一个字典中，方便后续根据名称获取对应的session对象
-         4.对于工具，还需要使用数组存储所有工具的结构信息，用于喂给大模型，让它知道我都有哪些工具可以调用
-         5.资源和提示的话，由于是用户主动查询的，所以只需要存储在字典中，方便根据名称获取对应的session并利用session执行mcp server的对应的资源和提示的函数，获取最终的资源和提示的结果
+         1.连接由 server_pool 中每个服务器自己的任务建立：配置里有command时启动一个stdio子进程，有url时连接到共享的HTTP服务(streamable-http或sse)，
+           任务在initialize之后同时获取该服务器上可用的工具、提示和资源，然后调用本函数；超过启动期限才连上的服务器，也会在后台连上后调用本函数
+         2.能力缓存(.mcp_capabilities.json)里有这个服务器时，启动时直接用缓存的列表调用本函数，不用等服务器启动，聊天马上可用；
+           服务器连上后如果发现版本或列表变了，会用新的列表再调用一次本函数，所以要先删掉这个连接之前登记的内容，再整体替换
+         3.服务器支持订阅时记下该连接，资源变化的通知由 handle_server_message 接收
+         4.对于工具，资源和提示，都将其的名称作为key，连接对象作为value存储在一个字典中，方便后续根据名称获取对应的连接，连接的用法和session对象一样
+         5.对于工具，还需要使用数组存储所有工具的结构信息，用于喂给大模型，让它知道我都有哪些工具可以调用
+         6.资源和提示的话，由于是用户主动查询的，所以只需要存储在字典中，方便根据名称获取对应的session并利用session执行mcp server的对应的资源和提示的函数，获取最终的资源和提示的结果
     """
-    async def connect_to_single_server(self,server_name, server_config: Dict[str, Any]):
+    def register_server(self, connection: ServerConnection):
         """
-        Connects to a single server using the provided server ID and address.
+        Registers the tools, prompts and resources of a server, replacing what it registered before.
         """
-        try:
-            parameters = StdioServerParameters(**server_config)
-            (read, write) = await self.async_exit_stack.enter_async_context(stdio_client(parameters))
-            session = await self.async_exit_stack.enter_async_context(ClientSession(read, write))
-            await session.initialize()
-
-            try:
-                # list available tools from the server
-                tools_responses = await session.list_tools()
-                for tool in tools_responses.tools:
-                    tool_definition = ToolDefinition(
-                        name=tool.name,
-                        description=tool.description,
-                        input_schema=tool.inputSchema
-                    )
-                    self.available_tools.append(tool_definition)
-                    self.sessions_mapping_resourceOrToolName[tool.name] = session
-
-                # list available prompts from the server
-                prompt_responses = await session.list_prompts()
-                if prompt_responses and prompt_responses.prompts:
-                    for prompt in prompt_responses.prompts:
-                        self.sessions_mapping_resourceOrToolName[prompt.name] = session
-                        # self.available_prompts.append({
-                        #     "name": prompt.name,
-                        #     "description": prompt.description,
-                        #     "arguments": prompt.arguments,
-                        # })
-                        self.available_prompts.append(vars(prompt))
-
-                # list available resources from the server
-                resource_responses = await session.list_resources()
-                if resource_responses and resource_responses.resources:
-                    for resource in resource_responses.resources:
-                        resource_uri = str(resource.uri)
-                        self.sessions_mapping_resourceOrToolName[resource_uri] = session
-
-            except Exception as e:
-                print(f"Error: {e}")
-
-        except Exception as e:
-            print(f"Failed to connect to server {server_name}: {e}")
+        mapping = {name: owner for name, owner in self.sessions_mapping_resourceOrToolName.items()
+                   if owner is not connection}
+        available_tools = [tool for tool in self.available_tools
+                           if self.sessions_mapping_resourceOrToolName.get(tool.name) is not connection]
+        available_prompts = [prompt for prompt in self.available_prompts
+                             if self.sessions_mapping_resourceOrToolName.get(prompt["name"]) is not connection]
+
+        for tool in connection.tools:
+            tool_definition = ToolDefinition(
+                name=tool.name,
+                description=tool.description,
+                input_schema=tool.inputSchema
+            )
+            available_tools.append(tool_definition)
+            mapping[tool.name] = connection
+
+        for prompt in connection.prompts:
+            mapping[prompt.name] = connection
+            available_prompts.append(vars(prompt))
+
+        for resource in connection.resources:
+            mapping[str(resource.uri)] = connection
+
+        # swap everything at once, a query running concurrently sees either the old or the new registration
+        self.sessions_mapping_resourceOrToolName = mapping
+        self.available_tools = available_tools
+        self.available_prompts = available_prompts
+        resources_capability = connection.initialize_result.capabilities.resources
+        if resources_capability and resources_capability.subscribe:
+            self.subscribable_sessions.add(connection)
+        else:
+            self.subscribable_sessions.discard(connection)
 
     """
     函数名： connect_to_servers
@@ -324,7 +415,13 @@ class MultiServerWithResourceAndPromptChatbot(object):
     输出： 无
     步骤拆解：
     1.读取服务器配置文件 server_config.json，获取所有服务器的配置信息
-    2.遍历所有服务器的配置信息，调用 connect_to_single_server 函数连接到每个服务器
+    2.交给 server_pool 同时启动所有服务器，每个服务器最多等到它的启动期限（配置中的startupTimeout，默认10秒），然后打印每个服务器的启动耗时报告
+    3.没有在期限内连上的服务器继续在后台启动，连上后自动登记，不阻塞聊天
+    4.能力缓存里已有的服务器不会在启动时创建进程，第一次调用它的工具、资源或提示时才启动；
+      空闲超过idleTimeout（默认600秒）的服务器会被关闭，forget_server_state 清掉它的订阅，下次调用时自动重启
+    5.连接后崩溃的服务器（请求时发现连接已关闭，或者空闲时的ping没有回应）会按指数退避自动重启，重启后重新调用 register_server 登记；
+      配置中的"replicas": N 会为该服务器多保留N-1个副本，按需启动，只读工具（readOnlyHint）的调用交给正在进行的调用最少的副本；
+      副本之间不共享进程内的状态，其余工具、资源和提示都只发给第一个副本
     """
     async def connect_to_servers(self):
         """
@@ -333,10 +430,9 @@ class MultiServerWithResourceAndPromptChatbot(object):
         try:
             with open("server_config.json", "r") as config_file:
                 server_configs:dict = json.load(config_file)
-                configs = server_configs.get("mcpServers", {})
-                for server_name, server_config in configs.items():
-                    await self.connect_to_single_server(server_name,server_config)
-                    print(f"Start to connect to server: {server_name}")
+            configs = server_configs.get("mcpServers", {})
+            print(f"Start to connect to servers: {', '.join(configs)}")
+            await self.server_pool.start(configs)
         except FileNotFoundError:
             print("Server configuration file not found. Please ensure 'server_config.json' exists.")
         except json.JSONDecodeError:
@@ -348,6 +444,7 @@ class MultiServerWithResourceAndPromptChatbot(object):
         """
         Cleans up resources and closes all sessions.
         """
+        await self.server_pool.close()
         await self.async_exit_stack.aclose()
         print("All sessions closed and resources cleaned up.")
 
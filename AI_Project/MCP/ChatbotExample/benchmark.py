@@ -0,0 +1,280 @@
+"""
+Benchmark suite of the research server on a synthetic papers/ tree.
+
+Generates <topics> x <papers> papers in the legacy papers/<topic>/papers_info.json
+layout, then drives the tools and resources in-process (through FastMCP, without
+a transport) and over stdio. Runs offline, searches are answered from the
+synthetic tree (PAPER_SOURCE=fixture:...). Prints, or writes with --out, a JSON
+report with p50/p95/p99 latency, throughput and peak RSS per handler, so two
+commits can be compared run against run.
+
+    uv run benchmark.py --topics 1000 --papers 100 --out bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from server_metrics import percentile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SYLLABLES = ["qua", "lat", "tice", "neu", "ral", "gra", "phe", "ne", "ker", "nel", "spec", "tral",
+             "bay", "sian", "top", "olo", "gic", "flu", "id", "ran", "dom", "op", "tic", "cor"]
+FIRST_NAMES = ["Ada", "Alan", "Grace", "Edsger", "Barbara", "Donald", "Leslie", "Tony", "Frances", "John"]
+LAST_NAMES = ["Lovelace", "Turing", "Hopper", "Dijkstra", "Liskov", "Knuth", "Lamport", "Hoare", "Allen", "Backus"]
+
+
+def make_vocabulary(rng: random.Random, size: int = 400) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def generate_tree(paper_dir: str, topics: int, papers: int, seed: int) -> Tuple[List[str], List[str]]:
+    """
+    Write a synthetic papers/ tree.
+    :returns: The topic keys and all paper IDs, in generation order.
+    """
+    # imported here so the worker processes below start without it
+    from paper_catalog import topic_key
+
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng)
+    keys: List[str] = []
+    paper_ids: List[str] = []
+    seen = set()
+    for t in range(topics):
+        key = topic_key(f"{rng.choice(vocabulary)} {rng.choice(vocabulary)}")
+        if key in seen:
+            key = f"{key}_{t}"
+        seen.add(key)
+        keys.append(key)
+        topic_words = key.split("_")[:2]
+
+        papers_info = {}
+        for p in range(papers):
+            paper_id = f"{2000 + t // 100}.{t % 100:02d}{p:03d}v1"
+            # every paper mentions its topic, so the fixture source finds it again
+            title = " ".join(topic_words + rng.sample(vocabulary, rng.randint(4, 8))).title()
+            summary = " ".join(topic_words + [rng.choice(vocabulary) for _ in range(rng.randint(80, 150))])
+            papers_info[paper_id] = {
+                "title": title,
+                "authors": [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}" for _ in range(rng.randint(1, 5))],
+                "summary": summary,
+                "pdf_url": f"http://arxiv.org/pdf/{paper_id}",
+                "published": f"{rng.randint(2000, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            }
+            paper_ids.append(paper_id)
+        os.makedirs(os.path.join(paper_dir, key), exist_ok=True)
+        with open(os.path.join(paper_dir, key, "papers_info.json"), "w") as json_file:
+            json.dump(papers_info, json_file)
+    return keys, paper_ids
+
+
+def build_plan(keys: List[str], paper_ids: List[str], iterations: int, seed: int) -> Dict[str, List[Dict]]:
+    """
+    The calls to make per handler, identical for every mode.
+    Each call is {"tool": name, "args": {...}} or {"resource": uri}.
+    """
+    rng = random.Random(seed + 1)
+    words = make_vocabulary(random.Random(seed))
+    n = iterations
+    return {
+        "extract_info": [{"tool": "extract_info", "args": {"paper_id": rng.choice(paper_ids)}}
+                         for _ in range(n)],
+        "extract_info_batch": [{"tool": "extract_info_batch", "args": {"paper_ids": rng.sample(paper_ids, 10)}}
+                               for _ in range(n)],
+        "search_local_papers": [{"tool": "search_local_papers", "args": {"query": " ".join(rng.sample(words, 2))}}
+                                for _ in range(n)],
+        "find_similar_papers": [{"tool": "find_similar_papers", "args": {"paper_id": rng.choice(paper_ids)}}
+                                for _ in range(n)],
+        "papers_by_author": [{"tool": "papers_by_author",
+                              "args": {"name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", "k": 20}}
+                             for _ in range(n)],
+        "papers_between": [{"tool": "papers_between",
+                            "args": {"start": f"{year}-01-01", "end": f"{year}-03-31", "topic": rng.choice(keys)}}
+                           for year in (rng.randint(2000, 2025) for _ in range(n))],
+        "find_duplicates": [{"tool": "find_duplicates", "args": {"paper_id": rng.choice(paper_ids)}}
+                            for _ in range(n)],
+        # every search scans the whole fixture tree in the stub source, keep it short
+        "search_papers": [{"tool": "search_papers", "args": {"topic": rng.choice(keys).replace("_", " ")}}
+                          for _ in range(max(1, n // 10))],
+        "get_available_folders": [{"resource": "papers://folders"} for _ in range(n)],
+        "get_topic_papers": [{"resource": f"papers://{rng.choice(keys)}"} for _ in range(n)],
+        "get_topic_papers_page": [{"resource": f"papers://{rng.choice(keys)}/page/20/20"} for _ in range(n)],
+        "get_unique_topic_papers": [{"resource": f"papers://{rng.choice(keys)}/unique"} for _ in range(n)],
+    }
+
+
+async def run_plan(plan: Dict[str, List[Dict]], call, concurrency: int) -> Dict[str, Dict]:
+    """
+    Run every handler's calls with `concurrency` callers and summarize the latencies.
+    args:
+    :param call: async function taking one call of the plan.
+    """
+    report = {}
+    for handler, calls in plan.items():
+        latencies: List[float] = []
+        errors = 0
+        queue = list(reversed(calls))
+
+        async def worker():
+            nonlocal errors
+            while queue:
+                item = queue.pop()
+                start = time.perf_counter()
+                try:
+                    await call(item)
+                except Exception:
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        report[handler] = {
+            "calls": len(calls),
+            "errors": errors,
+            "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0,
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+            "throughput_per_s": round(len(calls) / elapsed, 1) if elapsed else 0,
+        }
+    return report
+
+
+async def bench_inprocess(plan: Dict[str, List[Dict]], concurrency: int) -> Dict:
+    """
+    Import the server in this process and call its handlers through FastMCP. Runs in a worker process.
+    """
+    start = time.perf_counter()
+    import mcp_server
+    from server_metrics import peak_rss_kb
+    mcp_server.setup_server()
+    startup = time.perf_counter() - start
+
+    async def call(item):
+        if "tool" in item:
+            await mcp_server.mcp.call_tool(item["tool"], item["args"])
+        else:
+            await mcp_server.mcp.read_resource(item["resource"])
+
+    handlers = await run_plan(plan, call, concurrency)
+    return {"startup_s": round(startup, 3), "peak_rss_kb": peak_rss_kb(), "handlers": handlers}
+
+
+async def bench_stdio(plan: Dict[str, List[Dict]], concurrency: int, env: Dict[str, str]) -> Dict:
+    """
+    Spawn the server over stdio and call its handlers through a ClientSession.
+    """
+    from mcp import ClientSession, StdioServerParameters, stdio_client
+
+    parameters = StdioServerParameters(command=sys.executable, args=[os.path.join(HERE, "mcp_server.py")],
+                                       env=env, cwd=HERE)
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        async with stdio_client(parameters, errlog=devnull) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                startup = time.perf_counter() - start
+
+                async def call(item):
+                    if "tool" in item:
+                        result = await session.call_tool(item["tool"], item["args"])
+                        if result.isError:
+                            raise RuntimeError(result.content[0].text if result.content else "tool error")
+                    else:
+                        await session.read_resource(item["resource"])
+
+                handlers = await run_plan(plan, call, concurrency)
+                server_metrics = json.loads((await session.read_resource("metrics://server")).contents[0].text)
+    return {"startup_s": round(startup, 3), "peak_rss_kb": server_metrics.get("peak_rss_kb"), "handlers": handlers}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--topics", type=int, default=100)
+    parser.add_argument("--papers", type=int, default=100, help="papers per topic")
+    parser.add_argument("--iterations", type=int, default=200, help="calls per handler")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent callers per handler")
+    parser.add_argument("--modes", default="inprocess,stdio", help="comma separated: inprocess, stdio")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON report here instead of printing it")
+    parser.add_argument("--keep", help="generate the tree in this directory and keep it")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        # in-process run, started by the parent below with the environment already set up
+        with open(args.worker, "r") as plan_file:
+            plan = json.load(plan_file)
+        print(json.dumps(asyncio.run(bench_inprocess(plan, args.concurrency))))
+        return
+
+    scratch = args.keep or tempfile.mkdtemp(prefix="mcp-bench-")
+    paper_dir = os.path.join(scratch, "papers")
+    try:
+        start = time.perf_counter()
+        keys, paper_ids = generate_tree(paper_dir, args.topics, args.papers, args.seed)
+        generate_s = time.perf_counter() - start
+        plan = build_plan(keys, paper_ids, args.iterations, args.seed)
+        plan_path = os.path.join(scratch, "plan.json")
+        with open(plan_path, "w") as plan_file:
+            json.dump(plan, plan_file)
+
+        env = dict(os.environ, PAPER_DIR=paper_dir, PAPER_SOURCE=f"fixture:{paper_dir}")
+        report = {
+            "commit": git_commit(),
+            "config": {
+                "topics": args.topics, "papers_per_topic": args.papers, "iterations": args.iterations,
+                "concurrency": args.concurrency, "seed": args.seed,
+                "store": os.environ.get("PAPER_STORE", "sqlite"),
+            },
+            "generate_s": round(generate_s, 3),
+            "modes": {},
+        }
+        # in-process first: its startup includes the one-time migration and index build of the fresh tree
+        for mode in [mode.strip() for mode in args.modes.split(",") if mode.strip()]:
+            if mode == "inprocess":
+                worker = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--worker", plan_path,
+                     "--concurrency", str(args.concurrency)],
+                    cwd=HERE, env=env, capture_output=True, text=True, check=True,
+                )
+                report["modes"]["inprocess"] = json.loads(worker.stdout.strip().splitlines()[-1])
+            elif mode == "stdio":
+                report["modes"]["stdio"] = asyncio.run(bench_stdio(plan, args.concurrency, env))
+            else:
+                parser.error(f"unknown mode: {mode}")
+    finally:
+        if not args.keep:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as out_file:
+            out_file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
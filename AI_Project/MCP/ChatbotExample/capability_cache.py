@@ -0,0 +1,53 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional
+
+CAPABILITY_CACHE_FILE = os.environ.get("MCP_CAPABILITY_CACHE", ".mcp_capabilities.json")
+
+
+class CapabilityCache:
+    """
+    What every configured server offered the last time it was connected, kept on disk.
+
+    An entry holds the initialize result (server name, version and
+    capabilities) and the tool, prompt and resource listings of one server.
+    Entries are keyed by a hash of the server's config entry, so editing the
+    command, args, url or env of a server starts it without a cache entry.
+    The server version is part of the entry: a live listing that reports
+    another version or other listings replaces it. The file is rewritten
+    through a temporary file and os.replace, readers never see half of it.
+    """
+
+    def __init__(self, path: str = CAPABILITY_CACHE_FILE):
+        self.path = path
+        self._entries: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, "r") as cache_file:
+                return json.load(cache_file)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return {}
+
+    @staticmethod
+    def key(server_config: Dict[str, Any]) -> str:
+        return hashlib.sha256(json.dumps(server_config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def get(self, server_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return self._entries.get(self.key(server_config))
+
+    def put(self, server_config: Dict[str, Any], entry: Dict[str, Any]) -> bool:
+        """
+        Store the listings of one server.
+        :returns: False if the cache already held exactly this entry.
+        """
+        key = self.key(server_config)
+        if self._entries.get(key) == entry:
+            return False
+        self._entries[key] = entry
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as cache_file:
+            json.dump(self._entries, cache_file)
+        os.replace(tmp_path, self.path)
+        return True
@@ -0,0 +1,71 @@
+import functools
+import os
+import time
+from typing import Any, Callable, Optional, Tuple
+
+import httpx
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
+from anthropic.types import Message
+
+
+@functools.lru_cache(maxsize=None)
+def get_llm_client() -> AsyncAnthropic:
+    """
+    The AsyncAnthropic client shared by every chatbot in this process.
+
+    messages.create is awaited, so the event loop keeps serving MCP traffic,
+    notifications and other conversations while a completion is in flight.
+    One client means one pool of keep-alive connections to the API instead
+    of a new TLS handshake per chatbot. Timeouts and retries are set here:
+    the SDK retries connection errors, 408, 409, 429 and 5xx responses with
+    exponential backoff and jitter, and honours retry-after.
+
+    LLM_TIMEOUT (seconds per request, default 120), LLM_CONNECT_TIMEOUT
+    (default 10), LLM_MAX_RETRIES (default 3) and LLM_MAX_CONNECTIONS
+    (default 20) override the defaults.
+    :returns:
+     The shared client.
+    """
+    timeout = httpx.Timeout(float(os.environ.get("LLM_TIMEOUT", 120)),
+                            connect=float(os.environ.get("LLM_CONNECT_TIMEOUT", 10)))
+    max_connections = int(os.environ.get("LLM_MAX_CONNECTIONS", 20))
+    return AsyncAnthropic(
+        timeout=timeout,
+        max_retries=int(os.environ.get("LLM_MAX_RETRIES", 3)),
+        http_client=DefaultAsyncHttpxClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        ),
+    )
+
+
+async def stream_message(llm: AsyncAnthropic, on_tool_use: Optional[Callable[[Any], None]] = None,
+                         echo: bool = True, **request) -> Tuple[Message, Optional[float]]:
+    """
+    Stream one completion, printing text as it arrives.
+
+    tool_use blocks are handed to on_tool_use the moment their streamed input
+    JSON is complete, so a tool can already run while the model is still
+    writing the blocks after it.
+    args:
+    :param llm: The client, usually get_llm_client().
+    :param on_tool_use: Called with every finished tool_use block, in message order.
+    :param echo: Print text deltas to stdout.
+    :param request: The messages.create arguments.
+    :returns:
+     The complete message and the time to first token in seconds, None if nothing was streamed.
+    """
+    start = time.perf_counter()
+    first_token: Optional[float] = None
+    async with llm.messages.stream(**request) as stream:
+        async for event in stream:
+            if event.type in ("text", "input_json") and first_token is None:
+                first_token = time.perf_counter() - start
+            if event.type == "text" and echo:
+                print(event.text, end="", flush=True)
+            elif event.type == "content_block_stop" and event.content_block.type == "tool_use" and on_tool_use:
+                on_tool_use(event.content_block)
+        message = await stream.get_final_message()
+    if echo:
+        print()
+    return message, first_token
@@ -0,0 +1,152 @@
+"""
+Load test of the research server: one shared HTTP server versus one stdio server per client.
+
+Runs offline, the server answers searches from the papers/ fixtures
+(PAPER_SOURCE=fixture:papers) and writes into a scratch PAPER_DIR.
+
+    uv run load_test.py --clients 20 --calls 10 --mode both
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from mcp import ClientSession
+
+from server_metrics import percentile
+from server_transport import open_transport
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def fixture_topics(fixture_dir: str) -> List[str]:
+    return [
+        item for item in sorted(os.listdir(fixture_dir))
+        if os.path.isfile(os.path.join(fixture_dir, item, "papers_info.json"))
+    ] or ["computer"]
+
+
+async def run_client(server_config: Dict, topics: List[str], calls: int, rng: random.Random,
+                     call_ms: List[float]) -> float:
+    """
+    One client session: connect, initialize, a mix of tool calls and resource reads, disconnect.
+    :returns: The wall time of the whole session in milliseconds.
+    """
+    start = time.perf_counter()
+    async with open_transport(server_config) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            for _ in range(calls):
+                topic = rng.choice(topics)
+                call_start = time.perf_counter()
+                kind = rng.random()
+                if kind < 0.4:
+                    await session.call_tool("search_papers", {"topic": topic, "max_results": 5})
+                elif kind < 0.7:
+                    await session.call_tool("search_local_papers", {"query": topic, "k": 5})
+                elif kind < 0.9:
+                    await session.read_resource(f"papers://{topic}")
+                else:
+                    await session.read_resource("papers://folders")
+                call_ms.append((time.perf_counter() - call_start) * 1000)
+    return (time.perf_counter() - start) * 1000
+
+
+async def run_mode(mode: str, server_config: Dict, clients: int, calls: int, topics: List[str]) -> Dict:
+    call_ms: List[float] = []
+    rng = random.Random(0)
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(run_client(server_config, topics, calls, random.Random(rng.random()), call_ms) for _ in range(clients)),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - start
+    session_ms = [result for result in results if isinstance(result, float)]
+    errors = [result for result in results if isinstance(result, BaseException)]
+    for error in errors[:3]:
+        print(f"[{mode}] session failed: {error!r}", file=sys.stderr)
+    return {
+        "mode": mode,
+        "clients": clients,
+        "calls_per_client": calls,
+        "failed_sessions": len(errors),
+        "wall_seconds": round(elapsed, 3),
+        "sessions_per_second": round(len(session_ms) / elapsed, 2) if elapsed else 0,
+        "calls_per_second": round(len(call_ms) / elapsed, 2) if elapsed else 0,
+        "session_ms_p50": round(percentile(session_ms, 0.5), 1),
+        "session_ms_p99": round(percentile(session_ms, 0.99), 1),
+        "call_ms_p50": round(percentile(call_ms, 0.5), 2),
+        "call_ms_p99": round(percentile(call_ms, 0.99), 2),
+    }
+
+
+def wait_for_port(port: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"server did not listen on port {port} within {timeout}s")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=20, help="concurrent client sessions")
+    parser.add_argument("--calls", type=int, default=10, help="tool calls / resource reads per session")
+    parser.add_argument("--mode", choices=["http", "stdio", "both"], default="both")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", default=os.path.join(HERE, "papers"), help="papers/<topic>/papers_info.json tree")
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="mcp-load-")
+    env = dict(os.environ, PAPER_DIR=os.path.join(scratch, "papers"),
+               PAPER_SOURCE=f"fixture:{os.path.abspath(args.fixtures)}")
+    server_script = os.path.join(HERE, "mcp_server.py")
+    topics = fixture_topics(args.fixtures)
+    # warm the scratch tree once so neither mode pays for the first migration and index build
+    subprocess.run([sys.executable, "-c", "import mcp_server; mcp_server.setup_server()"], cwd=HERE, env=env, check=True)
+
+    reports = []
+    try:
+        if args.mode in ("http", "both"):
+            server = subprocess.Popen(
+                [sys.executable, server_script, "--transport", "streamable-http", "--port", str(args.port)],
+                cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                wait_for_port(args.port, timeout=30)
+                config = {"url": f"http://127.0.0.1:{args.port}/mcp/"}
+                reports.append(await run_mode("http", config, args.clients, args.calls, topics))
+            finally:
+                server.terminate()
+                server.wait(timeout=10)
+        if args.mode in ("stdio", "both"):
+            config = {"command": sys.executable, "args": [server_script], "env": env, "cwd": HERE}
+            reports.append(await run_mode("stdio", config, args.clients, args.calls, topics))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    for report in reports:
+        print(f"{report['mode']:>6}: {report['sessions_per_second']:8.2f} sessions/s "
+              f"{report['calls_per_second']:8.2f} calls/s  "
+              f"session p50 {report['session_ms_p50']:8.1f} ms p99 {report['session_ms_p99']:8.1f} ms  "
+              f"call p50 {report['call_ms_p50']:7.2f} ms p99 {report['call_ms_p99']:7.2f} ms  "
+              f"failed {report['failed_sessions']}")
+    if args.json_path:
+        with open(args.json_path, "w") as json_file:
+            json.dump(reports, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
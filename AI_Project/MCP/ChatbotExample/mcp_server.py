@@ -1,17 +1,267 @@
-import arxiv
+import argparse
+import asyncio
+import itertools
 import json
 import os
-from typing import List
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import unquote
 from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp.exceptions import ToolError
+from mcp.server.lowlevel import NotificationOptions
+from mcp.types import ToolAnnotations
+from pydantic import AnyUrl
+
+from paper_catalog import CATALOG_FILE, PaperCatalog, duplicate_topic_dirs, load_topic_aliases, topic_key
+from paper_dedup import DuplicateIndex
+from paper_embeddings import EmbeddingStore, embedder_from_env
+from paper_fulltext import FulltextStore, downloader_from_env
+from paper_indexes import PaperIndexes, valid_date_prefix
+from paper_journal import JournalCatalog
+from paper_pages import DEFAULT_PAGE_SIZE, TopicPages
+from paper_search import PaperSearchIndex
+from paper_source import QUERY_CACHE_DIR, source_from_env
+from resource_notifications import ResourceSubscriptions
+from server_metrics import ServerMetrics
+from topic_refresher import TopicRefresher
+
+# PAPER_DIR points the server at another papers tree, e.g. a scratch copy for load tests
+paper_dir = os.environ.get("PAPER_DIR", "papers")
+
+_refresher_task: Optional[asyncio.Task] = None
+_open_sessions = 0
+
+
+@asynccontextmanager
+async def refresher_lifespan(server):
+    """
+    Run the background topic refresher while at least one client session is open.
+
+    FastMCP enters the lifespan once per session, with the HTTP transport that
+    is once per client, so the refresher task is reference counted.
+    """
+    global _refresher_task, _open_sessions
+    _open_sessions += 1
+    if _refresher_task is None and refresher is not None:
+        _refresher_task = asyncio.create_task(refresher.run_forever())
+    try:
+        yield {}
+    finally:
+        _open_sessions -= 1
+        if _open_sessions == 0 and _refresher_task is not None:
+            _refresher_task.cancel()
+            _refresher_task = None
 
-paper_dir = "papers"
 
 # initialize fastmcp server
-mcp = FastMCP("research")
+mcp = FastMCP("research", lifespan=refresher_lifespan)
+
+# per handler latency, error and payload counters, served as metrics://server
+metrics = ServerMetrics()
+
+# sessions subscribed to papers:// resources, told when search_papers changes a topic
+subscriptions = ResourceSubscriptions()
+
+# the catalog, indexes, pools and refresher are built by setup_server(); importing this module
+# stays cheap because the spawned PDF extraction workers of fetch_fulltext re-import it as __mp_main__
+catalog = None
+source = None
+search_index: Optional[PaperSearchIndex] = None
+embedding_store: Optional[EmbeddingStore] = None
+paper_indexes: Optional[PaperIndexes] = None
+duplicate_index: Optional[DuplicateIndex] = None
+fulltext_store: Optional[FulltextStore] = None
+topic_pages: Optional[TopicPages] = None
+search_pool: Optional[ThreadPoolExecutor] = None
+storage_pool: Optional[ThreadPoolExecutor] = None
+fulltext_pool: Optional[ThreadPoolExecutor] = None
+refresher: Optional[TopicRefresher] = None
+
+# tools whose answer only depends on their arguments and papers that are already stored,
+# clients may memoize their results (see tool_cache.py); they report unknown papers and failed
+# downloads as errors, so a miss is never memoized and a later search_papers can fill it
+IDEMPOTENT = ToolAnnotations(readOnlyHint=True, idempotentHint=True)
+
+
+async def run_blocking(fn, *args):
+    """
+    Run a blocking catalog or index call on the storage pool.
+
+    Every handler is async, so with the HTTP transport one slow call does not
+    hold up the other client sessions served by this process.
+    """
+    return await asyncio.get_running_loop().run_in_executor(storage_pool, fn, *args)
+
+
+def store_results(found: Dict[str, Dict[str, Dict]]) -> Tuple[List[str], List[str]]:
+    """
+    Save search results to the catalog and update every index built on top of it.
+    :returns: The keys of the topics that changed, and the keys of the topics that are new.
+    """
+    known = {key for key in map(topic_key, found) if catalog.topic_version(key)}
+    changed = catalog.add_many(found)
+    papers = [(paper_id, paper_info) for papers_info in found.values() for paper_id, paper_info in papers_info.items()]
+    search_index.add_papers(papers)
+    embedding_store.add_papers(papers)
+    duplicate_index.add_papers(papers)
+    for topic, papers_info in found.items():
+        paper_indexes.add_papers(papers_info.items(), topic=topic_key(topic))
+    return changed, [key for key in changed if key not in known]
+
+
+def uri_topic_key(uri: str) -> Optional[str]:
+    """
+    Canonical topic of a papers://{topic}[/...] URI, None for other URIs and papers://folders.
+    """
+    if not uri.startswith("papers://"):
+        return None
+    topic = unquote(uri[len("papers://"):].split("/", 1)[0])
+    return None if topic == "folders" else topic_key(topic)
+
+
+async def store_and_notify(found: Dict[str, Dict[str, Dict]]) -> List[str]:
+    """
+    Store search results off the event loop, then notify the sessions subscribed to what changed.
+    :returns: The keys of the topics that changed.
+    """
+    changed, new_topics = await run_blocking(store_results, found)
+    await notify_changes(changed, new_topics)
+    return changed
+
+
+async def notify_changes(changed: List[str], new_topics: List[str]) -> None:
+    """
+    Tell subscribed sessions which papers:// resources are stale after a search stored papers.
+    """
+    changed_keys = set(changed)
+    stale = [uri for uri in subscriptions.uris() if uri_topic_key(uri) in changed_keys]
+    if new_topics:
+        stale.append("papers://folders")
+    await subscriptions.notify_updated(stale)
+    if new_topics:
+        # the set of topics readable through the papers://{topic} templates grew
+        await subscriptions.notify_list_changed()
+
+
+def select_hits(hits: Iterable[Tuple[str, object]], k: int,
+                collapse_duplicates: bool) -> List[Tuple[str, object, List[str]]]:
+    """
+    The first k hits, with near-duplicates folded into the first hit of their group if asked to.
+
+    hits may be a lazy iterator, it is read only until k entries are filled.
+    :returns: (paper ID, score, IDs of the duplicates folded into it) triples.
+    """
+    if not collapse_duplicates:
+        return [(paper_id, score, []) for paper_id, score in itertools.islice(hits, max(k, 0))]
+    scores = {}
+
+    def paper_ids():
+        for paper_id, score in hits:
+            scores[paper_id] = score
+            yield paper_id
+
+    kept = duplicate_index.collapse(paper_ids(), k)
+    return [(paper_id, scores[paper_id], duplicates) for paper_id, duplicates in kept]
+
+
+def batch_answer(response: List[Dict], **dump_options) -> str:
+    """
+    Json answer of a batch tool, raised as a tool error when one of its entries failed.
+
+    The client gets the whole list either way, the error flag only keeps it
+    out of the client caches of the IDEMPOTENT tools.
+    """
+    text = json.dumps(response, **dump_options)
+    if any("error" in entry for entry in response):
+        raise ToolError(text)
+    return text
+
+
+def hit_entry(paper_id: str, paper_info: Dict, field: str, value, duplicates: List[str],
+              with_authors: bool = False) -> Dict:
+    entry = {"paper_id": paper_id, "title": paper_info["title"]}
+    if with_authors:
+        entry["authors"] = paper_info["authors"]
+    if field != "published":
+        entry["published"] = paper_info["published"]
+    entry[field] = value
+    if duplicates:
+        entry["duplicates"] = duplicates
+    return entry
+
+
+async def render_hits(hits: List[Tuple[str, object]], k: int, field: str, collapse_duplicates: bool,
+                      with_authors: bool = False) -> str:
+    """
+    Shared Json rendering of the local lookup tools.
+    args:
+    :param hits: (paper ID, score) pairs, best first.
+    :param field: Name of the score in the Json entries.
+    :returns:
+     Json list of at most k papers, duplicates folded into the first paper of their group.
+    """
+    entries = select_hits(hits, k, collapse_duplicates)
+    papers = await run_blocking(catalog.get_papers, [paper_id for paper_id, _, _ in entries])
+    return json.dumps([
+        hit_entry(paper_id, papers[paper_id], field, value, duplicates, with_authors)
+        for paper_id, value, duplicates in entries if paper_id in papers
+    ], indent=2)
+
+
+async def search_topics(topics: List[str], max_results: int) -> Dict[str, List[str]]:
+    """
+    Shared implementation of search_papers_batch and search_papers.
+    """
+    loop = asyncio.get_running_loop()
+
+    # fan the topics out over the pool, the shared token bucket paces the arXiv calls
+    unique_topics = list(dict.fromkeys(topics))
+    results = await asyncio.gather(
+        *(loop.run_in_executor(search_pool, source.search, topic, max_results) for topic in unique_topics),
+        return_exceptions=True,
+    )
+
+    found = {}
+    errors = {}
+    for topic, result in zip(unique_topics, results):
+        if isinstance(result, BaseException):
+            errors[topic] = result
+        else:
+            found[topic] = result
+
+    #     Save every topic that succeeded in one transaction
+    if found:
+        await store_and_notify(found)
+    if errors and not found:
+        topic, error = next(iter(errors.items()))
+        raise RuntimeError(f"Search failed for topic {topic}: {error}")
+
+    response = {topic: list(papers_info) for topic, papers_info in found.items()}
+    for topic, error in errors.items():
+        response[topic] = [f"Error: {error}"]
+    return response
 
 
 @mcp.tool()
-def search_papers(topic: str, max_results: int = 5) -> List[str]:
+@metrics.instrument("tool")
+async def search_papers_batch(topics: List[str], max_results: int = 5) -> Dict[str, List[str]]:
+    """
+    Search arXiv for several topics at once and store their information.
+    args:
+    :param topics: The topics to search for papers on arXiv.
+    :param max_results: The maximum number of results to retrieve per topic. default is 5.
+    :returns:
+     Mapping of each topic to the list of paper IDs found for it.
+    """
+    return await search_topics(topics, max_results)
+
+
+@mcp.tool()
+@metrics.instrument("tool")
+async def search_papers(topic: str, max_results: int = 5) -> List[str]:
     """
     Search for papers on arXiv based on a topic and store their information.
     args:
@@ -20,77 +270,469 @@ def search_papers(topic: str, max_results: int = 5) -> List[str]:
     :returns:
      List of paper IDs found in the search.
     """
+    results = await search_topics([topic], max_results)
+    return results[topic]
 
-    # use arxiv to find the papers
-    client = arxiv.Client()
+@mcp.tool(annotations=IDEMPOTENT)
+@metrics.instrument("tool")
+async def extract_info(paper_id: str) -> str:
+    """
+    Search for information about a specific paper across all topic directories.
 
-    # Search for the most relevant articles matching the queried topic
-    search = arxiv.Search(
-        query=topic,
-        max_results=max_results,
-        sort_by=arxiv.SortCriterion.Relevance
-    )
+    args:
+        paper_id: The paper ID to look for
+    returns:
+        Json string with paper information if found, otherwise a tool error.
+    """
 
-    papers = client.results(search)
+    paper_info = await run_blocking(catalog.get_paper, paper_id)
+    if paper_info is not None:
+        return json.dumps(paper_info, indent=2)
+    raise ToolError(f"There's no saved information related to paper ID {paper_id}")
 
-    # create a directory to store the papers if it doesn't exist
-    path = os.path.join(paper_dir, topic.lower().replace(" ", "_"))
-    os.makedirs(path, exist_ok=True)
 
-    file_path = os.path.join(path, "papers_info.json")
+PAPER_FIELDS = ("title", "authors", "summary", "pdf_url", "published")
+
+
+@mcp.tool(annotations=IDEMPOTENT)
+@metrics.instrument("tool")
+async def extract_info_batch(paper_ids: List[str], fields: Optional[List[str]] = None) -> str:
+    """
+    Get information about several papers at once.
+
+    args:
+        paper_ids: The paper IDs to look for
+        fields: Only return these fields, any of title, authors, summary, pdf_url and published.
+                default is all of them. Leave out summary when it is not needed.
+    returns:
+        Compact json array with one object per requested paper, in the requested order,
+        reported as a tool error if a paper was not found.
+    """
+    fields = [field for field in (fields or PAPER_FIELDS) if field in PAPER_FIELDS]
+    # one lookup for all IDs instead of one extract_info round-trip each
+    papers = await run_blocking(catalog.get_papers, list(dict.fromkeys(paper_ids)))
+
+    response = []
+    for paper_id in paper_ids:
+        paper_info = papers.get(paper_id)
+        if paper_info is None:
+            response.append({"paper_id": paper_id, "error": "not found"})
+        else:
+            response.append({"paper_id": paper_id, **{field: paper_info[field] for field in fields}})
+    return batch_answer(response, separators=(",", ":"), ensure_ascii=False)
 
-    try:
-        with open(file_path, "r") as json_file:
-            papers_info = json.load(json_file)
-    except (FileNotFoundError, json.decoder.JSONDecodeError):
-        papers_info = {}
-
-    #     Process each paper and add to papers_info
-    paper_ids = []
-    for paper in papers:
-        paper_ids.append(paper.get_short_id())
-        paper_info = {
-            "title": paper.title,
-            "authors": [author.name for author in paper.authors],
-            "summary": paper.summary,
-            "pdf_url": paper.pdf_url,
-            "published": str(paper.published.date()),
-        }
-        papers_info[paper.get_short_id()] = paper_info
-
-    #     Save updated papers_info to JSON file
-    with open(file_path, "w") as json_file:
-        json.dump(papers_info, json_file, indent=2)
-
-    print(f"Results are saved in {file_path}")
-    return papers_info
 
 @mcp.tool()
-def extract_info(paper_id: str) -> str:
+@metrics.instrument("tool")
+async def search_local_papers(query: str, k: int = 10, collapse_duplicates: bool = True) -> str:
     """
-    Search for information about a specific paper across all topic directories.
+    Full text search over the papers that are already stored, without contacting arXiv.
 
     args:
-        paper_id: The paper ID to look for
+        query: Free text matched against title, authors and summary
+        k: The maximum number of papers to return. default is 10.
+        collapse_duplicates: Show near-duplicates, e.g. other versions of a paper, as one entry. default is True.
+    returns:
+        Json list of the best matching papers with their BM25 score.
+    """
+    # over-fetch so k papers are left after near-duplicates are folded away
+    hits = await run_blocking(search_index.search, query, k * 2 if collapse_duplicates else k)
+    return await render_hits(hits, k, "score", collapse_duplicates)
+
+
+@mcp.tool()
+@metrics.instrument("tool")
+async def find_similar_papers(paper_id: str = "", text: str = "", k: int = 5,
+                              collapse_duplicates: bool = True) -> str:
+    """
+    Find stored papers whose summary is semantically close to a paper or a piece of text.
+
+    args:
+        paper_id: ID of a stored paper to find neighbours of
+        text: Free text to compare against, used when paper_id is empty
+        k: The maximum number of papers to return. default is 5.
+        collapse_duplicates: Show near-duplicates, e.g. other versions of a paper, as one entry. default is True.
+    returns:
+        Json list of the most similar papers with their cosine similarity, a tool error for an unknown paper.
+    """
+    fetch = k * 2 if collapse_duplicates else k
+    if paper_id:
+        hits = await run_blocking(embedding_store.similar_to_paper, paper_id, fetch)
+        if hits is None:
+            raise ToolError(f"There's no saved information related to paper ID {paper_id}")
+        if collapse_duplicates:
+            # copies of the paper itself are not interesting neighbours
+            copies = {other for other, _ in duplicate_index.duplicates_of(paper_id) or ()}
+            hits = [hit for hit in hits if hit[0] not in copies]
+    elif text:
+        hits = await run_blocking(embedding_store.similar_to_text, text, fetch)
+    else:
+        raise ToolError("Please provide either a paper_id or a text to compare against.")
+    return await render_hits(hits, k, "similarity", collapse_duplicates)
+
+
+@mcp.tool()
+@metrics.instrument("tool")
+async def papers_by_author(name: str, k: int = 20, collapse_duplicates: bool = True) -> str:
+    """
+    Find stored papers by an author, newest first, without contacting arXiv.
+
+    args:
+        name: The author, "Alan Turing", "Turing, Alan" and "A. Turing" all match
+        k: The maximum number of papers to return. default is 20.
+        collapse_duplicates: Show near-duplicates, e.g. other versions of a paper, as one entry. default is True.
+    returns:
+        Json list of the author's papers.
+    """
+    hits = paper_indexes.by_author(name, k * 2 if collapse_duplicates else k)
+    return await render_hits(hits, k, "published", collapse_duplicates, with_authors=True)
+
+
+@mcp.tool()
+@metrics.instrument("tool")
+async def papers_between(start: str, end: str, topic: str = "", k: int = 50,
+                         collapse_duplicates: bool = True) -> str:
+    """
+    Find stored papers published in a date range, oldest first, without contacting arXiv.
+
+    args:
+        start: First publication date, YYYY-MM-DD, or a prefix such as 2023 or 2023-06
+        end: Last publication date, inclusive, a prefix covers the whole year or month
+        topic: Only papers stored for this topic. default is all topics.
+        k: The maximum number of papers to return. default is 50.
+        collapse_duplicates: Show near-duplicates, e.g. other versions of a paper, as one entry. default is True.
+    returns:
+        Json object with the number of papers in the range and the first k of them.
+        A malformed date or a start after the end is a tool error.
+    """
+    # garbage would silently match nothing and look like an empty range
+    for name, value in (("start", start), ("end", end)):
+        if not valid_date_prefix(value):
+            raise ToolError(f"{name} must be a date YYYY-MM-DD or a prefix YYYY or YYYY-MM, got {value!r}")
+    # "\uffff" as in the index, start 2023-06 with end 2023 is fine, start 2024 with end 2023-12 is not
+    if start > end + "\uffff":
+        raise ToolError(f"start {start} is after end {end}")
+    key = topic_key(topic) if topic else None
+    # total counts every stored paper in the range, duplicates included, the bounds are enough for that
+    total = paper_indexes.count_between(start, end, key)
+    # only the start of the range is read, as far as it takes to fill k entries
+    entries = select_hits(paper_indexes.between(start, end, key, chunk=max(k, 1) * 2), k, collapse_duplicates)
+    papers = await run_blocking(catalog.get_papers, [paper_id for paper_id, _, _ in entries])
+    return json.dumps({
+        "total": total,
+        "papers": [hit_entry(paper_id, papers[paper_id], "published", published, duplicates)
+                   for paper_id, published, duplicates in entries if paper_id in papers],
+    }, indent=2)
+
+
+@mcp.tool()
+@metrics.instrument("tool")
+async def find_duplicates(paper_id: str = "", k: int = 20) -> str:
+    """
+    Find stored papers that are near-duplicates, e.g. several versions or re-uploads of one paper.
+
+    args:
+        paper_id: ID of a stored paper to find the duplicates of, default is the largest duplicate groups.
+        k: The maximum number of groups to return when no paper_id is given. default is 20.
     returns:
-        Json string with paper information if found, otherwise an error message.
+        Json list of the paper's duplicates with their estimated similarity, or of duplicate groups.
+        An unknown paper_id is a tool error.
     """
+    if paper_id:
+        found = await run_blocking(duplicate_index.duplicates_of, paper_id)
+        if found is None:
+            raise ToolError(f"There's no saved information related to paper ID {paper_id}")
+        papers = await run_blocking(catalog.get_papers, [other for other, _ in found])
+        return json.dumps([
+            {"paper_id": other, "title": papers[other]["title"], "similarity": similarity}
+            for other, similarity in found if other in papers
+        ], indent=2)
+
+    groups = (await run_blocking(duplicate_index.groups))[:k]
+    papers = await run_blocking(catalog.get_papers, [member for group in groups for member in group])
+    return json.dumps([
+        [{"paper_id": member, "title": papers[member]["title"]} for member in group if member in papers]
+        for group in groups
+    ], indent=2)
 
-    for item in os.listdir(paper_dir):
-        item_path = os.path.join(paper_dir, item)
-        if os.path.isdir(item_path):
-            file_path = os.path.join(item_path, "papers_info.json")
-            if os.path.isfile(file_path):
-                try:
-                    with open(file_path, "r") as json_file:
-                        papers_info = json.load(json_file)
-                        if paper_id in papers_info:
-                            return json.dumps(papers_info[paper_id], indent=2)
-                except (FileNotFoundError, json.decoder.JSONDecodeError) as e:
-                    print(f"Error reading {file_path}: {str(e)}")
-                    continue
-    return f"Theres's no saved information related to paper ID {paper_id}"
+
+@mcp.tool(annotations=IDEMPOTENT)
+@metrics.instrument("tool")
+async def fetch_fulltext(paper_ids: List[str], max_chars: int = 20000) -> str:
+    """
+    Download the PDFs of stored papers and return their extracted text.
+
+    args:
+        paper_ids: IDs of papers stored by search_papers
+        max_chars: The maximum number of characters of text returned per paper. default is 20000.
+    returns:
+        Json list with the text, or an error message, for every requested paper,
+        reported as a tool error if one of them failed.
+    """
+    papers = await run_blocking(catalog.get_papers, paper_ids)
+    pdf_urls = {paper_id: papers[paper_id]["pdf_url"] for paper_id in paper_ids if paper_id in papers}
+
+    # downloads and extraction block, keep them off the server loop
+    loop = asyncio.get_running_loop()
+    results = await loop.run_in_executor(fulltext_pool, fulltext_store.fetch, pdf_urls)
+
+    response = []
+    for paper_id in dict.fromkeys(paper_ids):
+        result = results.get(paper_id)
+        if result is None:
+            response.append({"paper_id": paper_id,
+                             "error": f"There's no saved information related to paper ID {paper_id}"})
+        elif result["status"] == "error":
+            response.append({"paper_id": paper_id, "error": result["error"]})
+        else:
+            response.append({
+                "paper_id": paper_id,
+                "status": result["status"],
+                "chars": len(result["text"]),
+                "text": result["text"][:max_chars],
+            })
+    return batch_answer(response, indent=2)
+
+
+@mcp.resource("papers://folders")
+@metrics.instrument("resource")
+async def get_available_folders() -> str:
+    """
+    List all available topic folders in the papers directory.
+
+    This resource provides a simple list of all available topic folders.
+    """
+    # stored under stemmed keys, shown as they were first searched
+    folders = list((await run_blocking(catalog.topic_display_names)).values())
+
+    # Create a simple markdown list
+    lines = ["# Available Topics", ""]
+    if folders:
+        lines.extend(f"- {folder}" for folder in folders)
+        lines.extend(["", "Use @<topic> to access the papers of a topic."])
+    else:
+        lines.append("No topics found.")
+    return "\n".join(lines) + "\n"
+
+
+@mcp.resource("papers://{topic}")
+@metrics.instrument("resource")
+async def get_topic_papers(topic: str) -> str:
+    """
+    Get detailed information about papers on a specific topic.
+
+    Large topics are split into pages, the first page ends with the URI of the next one.
+
+    Args:
+        topic: The research topic to retrieve papers for
+    """
+    return await run_blocking(topic_pages.render, topic, 0, DEFAULT_PAGE_SIZE)
+
+
+@mcp.resource("papers://{topic}/page/{cursor}/{limit}")
+@metrics.instrument("resource")
+async def get_topic_papers_page(topic: str, cursor: str, limit: str) -> str:
+    """
+    Get one page of papers on a specific topic.
+
+    Args:
+        topic: The research topic to retrieve papers for
+        cursor: Position of the first paper on the page, taken from the previous page
+        limit: The maximum number of papers on the page
+    """
+    try:
+        page = (int(cursor), int(limit))
+    except ValueError:
+        return f"# Invalid page cursor for topic: {topic}\n\nUse the next page URI from the previous page."
+    return await run_blocking(topic_pages.render, topic, *page)
+
+
+@mcp.resource("papers://{topic}/unique")
+@metrics.instrument("resource")
+async def get_unique_topic_papers(topic: str) -> str:
+    """
+    Get the papers on a specific topic with near-duplicates, e.g. other versions of a paper, collapsed.
+
+    Args:
+        topic: The research topic to retrieve papers for
+    """
+    return await run_blocking(topic_pages.render, topic, 0, DEFAULT_PAGE_SIZE, True)
+
+
+@mcp.resource("papers://{topic}/unique/page/{cursor}/{limit}")
+@metrics.instrument("resource")
+async def get_unique_topic_papers_page(topic: str, cursor: str, limit: str) -> str:
+    """
+    Get one page of papers on a specific topic with near-duplicates collapsed.
+
+    Args:
+        topic: The research topic to retrieve papers for
+        cursor: Position of the first paper on the page, taken from the previous page
+        limit: The maximum number of papers on the page
+    """
+    try:
+        page = (int(cursor), int(limit))
+    except ValueError:
+        return f"# Invalid page cursor for topic: {topic}\n\nUse the next page URI from the previous page."
+    return await run_blocking(topic_pages.render, topic, *page, True)
+
+
+@mcp.resource("papers://{topic}/since/{version}")
+@metrics.instrument("resource")
+async def get_topic_papers_since(topic: str, version: str) -> str:
+    """
+    Conditional read of papers://{topic}: a one line answer while the topic is still at the given version.
+
+    Args:
+        topic: The research topic to retrieve papers for
+        version: The Version line of the copy the client already has
+    """
+    current = await run_blocking(catalog.topic_version, topic)
+    if version == str(current):
+        return f"Not modified: papers://{topic} is still at version {current}"
+    return await run_blocking(topic_pages.render, topic, 0, DEFAULT_PAGE_SIZE)
+
+
+# FastMCP has no decorators for these, register them on the low level server it wraps
+@mcp._mcp_server.subscribe_resource()
+async def subscribe_resource(uri: AnyUrl) -> None:
+    subscriptions.subscribe(str(uri), mcp.get_context().session)
+
+
+@mcp._mcp_server.unsubscribe_resource()
+async def unsubscribe_resource(uri: AnyUrl) -> None:
+    subscriptions.unsubscribe(str(uri), mcp.get_context().session)
+
+
+_create_initialization_options = mcp._mcp_server.create_initialization_options
+
+
+def create_initialization_options(notification_options=None, experimental_capabilities=None):
+    # the low level server always announces subscribe=False, announce the handlers registered above
+    options = _create_initialization_options(NotificationOptions(resources_changed=True), experimental_capabilities)
+    options.capabilities.resources.subscribe = True
+    return options
+
+
+mcp._mcp_server.create_initialization_options = create_initialization_options
+
+
+@mcp.resource("cache://arxiv")
+@metrics.instrument("resource")
+def get_search_cache_stats() -> str:
+    """
+    Hit and miss counters of the arXiv query cache.
+    """
+    return json.dumps(source.get_stats(), indent=2)
+
+
+@mcp.resource("metrics://server")
+def get_server_metrics() -> str:
+    """
+    Call counts, latency histograms, error counts and response sizes of every tool and resource.
+    """
+    return json.dumps(metrics.snapshot(), indent=2)
+
+
+@mcp.resource("metrics://prometheus", mime_type="text/plain")
+def get_server_metrics_prometheus() -> str:
+    """
+    The server metrics in the Prometheus text exposition format.
+    """
+    return metrics.prometheus_text()
+
+
+def setup_server() -> None:
+    """
+    Open the catalog under PAPER_DIR and build everything the handlers work on.
+
+    Called once before the server runs, and by scripts that drive the handlers
+    in-process. Nothing here runs at import time, so processes that merely
+    import this module do not open the catalog, build indexes or start threads.
+    """
+    global catalog, source, search_index, embedding_store, paper_indexes, duplicate_index
+    global fulltext_store, topic_pages, search_pool, storage_pool, fulltext_pool, refresher
+
+    # papers/topic_aliases.json maps extra spellings of a topic onto one canonical topic
+    load_topic_aliases(paper_dir)
+
+    # PAPER_STORE=journal keeps the plain papers/<topic>/ file layout, the default is the SQLite catalog
+    if os.environ.get("PAPER_STORE", "sqlite") == "journal":
+        catalog = JournalCatalog(paper_dir)
+    else:
+        # the first start imports the legacy papers/<topic>/papers_info.json directories
+        fresh_catalog = not os.path.exists(os.path.join(paper_dir, CATALOG_FILE))
+        catalog = PaperCatalog(paper_dir)
+        if fresh_catalog:
+            catalog.migrate_json_dirs()
+    # topics stored under an older, non-canonical spelling are folded by "python paper_catalog.py compact",
+    # never at startup: folding rewrites and deletes topic directories
+    if duplicate_topic_dirs(paper_dir):
+        print(f"Topics in {paper_dir} are stored under non-canonical names, "
+              f"run 'python paper_catalog.py compact {paper_dir}' to fold them", file=sys.stderr)
+
+    # arXiv (or PAPER_SOURCE=fixture:<dir>) behind a memory + disk query cache
+    source = source_from_env(os.path.join(paper_dir, QUERY_CACHE_DIR))
+
+    # BM25 index for search_local_papers, built once from the catalog and then kept up to date on ingest
+    search_index = PaperSearchIndex(paper_dir)
+    if len(search_index) == 0:
+        search_index.add_papers(catalog.iter_papers())
+
+    # summary embeddings for find_similar_papers, only new or changed summaries are embedded
+    embedding_store = EmbeddingStore(paper_dir, embedder_from_env())
+    if len(embedding_store) == 0:
+        embedding_store.add_papers(catalog.iter_papers())
+
+    # author and publication date indexes for papers_by_author and papers_between, rebuilt at every start
+    paper_indexes = PaperIndexes()
+    paper_indexes.add_papers(catalog.iter_papers())
+    for topic in catalog.list_topics():
+        paper_indexes.add_topic_members(topic, catalog.topic_paper_ids(topic))
+
+    # MinHash near-duplicate groups over the summaries, rebuilt at every start in the background
+    # because a large catalog takes seconds to sign; until it is done fewer duplicates are collapsed
+    duplicate_index = DuplicateIndex()
+    threading.Thread(target=duplicate_index.add_papers, args=(catalog.iter_papers(),),
+                     name="dedup-build", daemon=True).start()
+
+    # PDF downloads and extracted text for fetch_fulltext (FULLTEXT_SOURCE=local:<dir> for tests)
+    fulltext_store = FulltextStore(paper_dir, downloader_from_env())
+
+    # papers://{topic} is rendered page by page from the catalog
+    topic_pages = TopicPages(catalog, dedup=duplicate_index)
+
+    # bounded pool for the blocking arXiv and download calls, keeps the server loop free
+    search_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("SEARCH_WORKERS", 4)),
+                                     thread_name_prefix="search")
+    # catalog and index reads get their own pool so they never queue behind a rate limited arXiv call
+    storage_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("STORAGE_WORKERS", 8)),
+                                      thread_name_prefix="storage")
+    # fetch_fulltext waits for downloads and extraction, on its own pool so it never holds up arXiv searches
+    fulltext_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("FULLTEXT_WORKERS", 2)),
+                                       thread_name_prefix="fulltext")
+
+    # keeps stored topics current in the background, REFRESH_INTERVAL=0 turns it off
+    refresh_interval = float(os.environ.get("REFRESH_INTERVAL", 6 * 3600))
+    refresher = TopicRefresher(
+        paper_dir, catalog, source, search_pool, store_and_notify,
+        interval=refresh_interval,
+        workers=int(os.environ.get("REFRESH_WORKERS", 2)),
+        max_results=int(os.environ.get("REFRESH_MAX_RESULTS", 50)),
+    ) if refresh_interval > 0 else None
 
 
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
\ No newline at end of file
+    # stdio serves one client, --transport streamable-http (or sse) serves many clients from one
+    # process that shares the catalog, caches and indexes, e.g. a server_config.json entry
+    # {"url": "http://127.0.0.1:8000/mcp/"} instead of {"command": "uv", ...}
+    parser = argparse.ArgumentParser(description="Research MCP server")
+    parser.add_argument("--transport", choices=["stdio", "sse", "streamable-http"], default="stdio")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    setup_server()
+    mcp.settings.host = args.host
+    mcp.settings.port = args.port
+    mcp.run(transport=args.transport)
@@ -0,0 +1,509 @@
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+import unicodedata
+from typing import Dict, Iterator, List, Optional, Tuple
+
+CATALOG_FILE = "catalog.sqlite3"
+ALIASES_FILE = "topic_aliases.json"
+# journal layout: the display name of a topic, next to its journal
+DISPLAY_FILE = "display_name"
+# journal layout: the version of a topic, bumped with every change to its papers
+VERSION_FILE = "version"
+
+# quotes the model or the user sometimes wrap a topic in, e.g. '"computer"'
+QUOTE_CHARS = "\"'`\u2018\u2019\u201c\u201d\u00ab\u00bb"
+
+# alias -> canonical topic, loaded from papers/topic_aliases.json by load_topic_aliases
+_topic_aliases: Dict[str, str] = {}
+# canonical topic -> its display name as written in topic_aliases.json
+_alias_display: Dict[str, str] = {}
+# TOPIC_STEMMING=0 keeps plural forms as separate topics
+_stemming = os.environ.get("TOPIC_STEMMING", "1") != "0"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    paper_id  TEXT PRIMARY KEY,
+    title     TEXT NOT NULL,
+    authors   TEXT NOT NULL,
+    summary   TEXT NOT NULL,
+    pdf_url   TEXT NOT NULL,
+    published TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS topics (
+    topic   TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    display TEXT
+);
+CREATE TABLE IF NOT EXISTS topic_papers (
+    topic    TEXT NOT NULL REFERENCES topics(topic),
+    paper_id TEXT NOT NULL REFERENCES papers(paper_id),
+    PRIMARY KEY (topic, paper_id)
+) WITHOUT ROWID;
+"""
+
+
+def _stem(word: str) -> str:
+    """
+    Very light plural stemmer, enough to fold "computers" into "computer".
+    """
+    if len(word) <= 3:
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("sses"):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def _normalize(topic: str, stem: bool = True) -> str:
+    topic = unicodedata.normalize("NFKD", topic)
+    topic = "".join(ch for ch in topic if not unicodedata.combining(ch)).casefold()
+    words = re.split(r"[\s_\-]+", topic.strip().strip(QUOTE_CHARS).strip())
+    words = [word.strip(QUOTE_CHARS) for word in words]
+    if stem and _stemming:
+        words = [_stem(word) for word in words]
+    return "_".join(word for word in words if word)
+
+
+def topic_key(topic: str) -> str:
+    """
+    Turn a user supplied topic into the canonical key used for storage.
+
+    Quotes are stripped, accents folded, case and whitespace ignored, plural
+    words stemmed and the result looked up in the alias table, so '"Computers"',
+    'computer' and 'Computer ' all end up in the same topic.
+    args:
+    :param topic: The topic as typed by the user or the model.
+    :returns:
+     The storage key, e.g. "Quantum Computers" -> "quantum_computer".
+    """
+    key = _normalize(topic)
+    return _topic_aliases.get(key, key)
+
+
+def display_name(topic: str) -> str:
+    """
+    The name a topic is shown under, e.g. in papers://folders.
+
+    Normalized like topic_key but not stemmed, "Physics" is shown as
+    "physics" although it is stored under "physic". An alias shows the
+    canonical topic it stands for.
+    args:
+    :param topic: The topic as typed by the user or the model.
+    :returns:
+     The display name, topic_key of it is the storage key of the topic.
+    """
+    key = _normalize(topic)
+    if key in _topic_aliases:
+        return _alias_display[_topic_aliases[key]]
+    return _normalize(topic, stem=False)
+
+
+def load_topic_aliases(paper_dir: str) -> Dict[str, str]:
+    """
+    Load papers/topic_aliases.json, a {"alias": "canonical topic"} mapping.
+
+    Both sides go through the same normalization as topic_key, so the file can
+    be written with the topics as people type them.
+    """
+    _topic_aliases.clear()
+    _alias_display.clear()
+    file_path = os.path.join(paper_dir, ALIASES_FILE)
+    if os.path.isfile(file_path):
+        with open(file_path, "r") as json_file:
+            for alias, canonical in json.load(json_file).items():
+                _topic_aliases[_normalize(alias)] = _normalize(canonical)
+                _alias_display[_normalize(canonical)] = _normalize(canonical, stem=False)
+    return dict(_topic_aliases)
+
+
+def read_topic_version(topic_path: str) -> Optional[int]:
+    """
+    The version stored in a topic directory of the journal layout, None if it has none yet.
+    """
+    try:
+        with open(os.path.join(topic_path, VERSION_FILE), "r") as version_file:
+            return int(version_file.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_topic_version(topic_path: str, version: int) -> None:
+    tmp_path = os.path.join(topic_path, f"{VERSION_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as version_file:
+        version_file.write(str(version))
+    os.replace(tmp_path, os.path.join(topic_path, VERSION_FILE))
+
+
+def duplicate_topic_dirs(paper_dir: str) -> Dict[str, List[str]]:
+    """
+    Find topic directories whose names normalize to the same key, or to a different one.
+    returns:
+     Mapping of canonical topic to all directories that belong to it, only for
+     topics that are not stored in exactly one canonically named directory.
+    """
+    groups: Dict[str, List[str]] = {}
+    for item in sorted(os.listdir(paper_dir)):
+        item_path = os.path.join(paper_dir, item)
+        if os.path.isdir(item_path) and (os.path.isfile(os.path.join(item_path, "papers_info.json"))
+                                         or os.path.isfile(os.path.join(item_path, "journal.jsonl"))):
+            groups.setdefault(topic_key(item), []).append(item)
+    return {key: items for key, items in groups.items() if items != [key]}
+
+
+def fold_topic_dirs(paper_dir: str, groups: Optional[Dict[str, List[str]]] = None) -> Dict[str, List[str]]:
+    """
+    Merge legacy topic directories that belong to the same canonical topic.
+
+    papers/"computer", papers/computers and papers/computer all become
+    papers/computer. Journals left by the journal store are folded into the
+    merged papers_info.json. Callers that share paper_dir with running servers
+    must hold the topic locks, see JournalCatalog.compact_topics.
+    args:
+    :param groups: Result of duplicate_topic_dirs, computed when not given.
+    :returns:
+     Mapping of canonical topic to the directories that were folded into it.
+    """
+    if groups is None:
+        groups = duplicate_topic_dirs(paper_dir)
+
+    folded = {}
+    for key, items in groups.items():
+        papers_info: Dict[str, Dict] = {}
+        # the canonical directory goes last so its copy of a paper wins
+        for item in sorted(items, key=lambda name: name == key):
+            item_path = os.path.join(paper_dir, item)
+            try:
+                with open(os.path.join(item_path, "papers_info.json"), "r") as json_file:
+                    papers_info.update(json.load(json_file))
+            except (FileNotFoundError, json.decoder.JSONDecodeError):
+                pass
+            journal_path = os.path.join(item_path, "journal.jsonl")
+            if os.path.isfile(journal_path):
+                with open(journal_path, "r") as journal:
+                    for line in journal:
+                        if line.strip():
+                            record = json.loads(line)
+                            papers_info[record["id"]] = record["info"]
+
+        key_path = os.path.join(paper_dir, key)
+        os.makedirs(key_path, exist_ok=True)
+        # above every version a client may have seen of any of the folded directories
+        version = max((read_topic_version(os.path.join(paper_dir, item)) or 1) for item in items) + 1
+        tmp_path = os.path.join(key_path, "papers_info.json.tmp")
+        with open(tmp_path, "w") as json_file:
+            json.dump(papers_info, json_file, indent=2)
+        os.replace(tmp_path, os.path.join(key_path, "papers_info.json"))
+        # truncate rather than delete, a writer may still hold the journal open
+        if os.path.isfile(os.path.join(key_path, "journal.jsonl")):
+            os.truncate(os.path.join(key_path, "journal.jsonl"), 0)
+        write_topic_version(key_path, version)
+        if not os.path.isfile(os.path.join(key_path, DISPLAY_FILE)):
+            # a legacy directory was named as the topic was typed, that is its display name
+            legacy = [item for item in items if item != key]
+            with open(os.path.join(key_path, DISPLAY_FILE), "w") as display_file:
+                display_file.write(display_name(legacy[0] if legacy else key))
+        for item in items:
+            if item != key:
+                shutil.rmtree(os.path.join(paper_dir, item))
+        folded[key] = [item for item in items if item != key]
+    return folded
+
+
+class PaperCatalog:
+    """
+    SQLite backed paper catalog.
+
+    Papers are stored once, keyed by their arXiv short ID, and a topic is just a
+    membership list pointing at those rows, so a lookup by ID is a single
+    primary-key probe instead of a walk over every topic directory.
+    """
+
+    def __init__(self, paper_dir: str):
+        self.paper_dir = paper_dir
+        os.makedirs(paper_dir, exist_ok=True)
+        self.db_path = os.path.join(paper_dir, CATALOG_FILE)
+        # tools may be called from worker threads, so one connection guarded by a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(topics)")]
+        if "display" not in columns:
+            # catalogs created before topics had display names
+            self._conn.execute("ALTER TABLE topics ADD COLUMN display TEXT")
+        self._conn.commit()
+
+    @staticmethod
+    def _row_to_info(row: Tuple) -> Dict:
+        title, authors, summary, pdf_url, published = row
+        return {
+            "title": title,
+            "authors": json.loads(authors),
+            "summary": summary,
+            "pdf_url": pdf_url,
+            "published": published,
+        }
+
+    def add_papers(self, topic: str, papers_info: Dict[str, Dict]) -> None:
+        """
+        Store papers and record them as members of a topic.
+        args:
+        :param topic: The topic the papers were found for.
+        :param papers_info: Mapping of paper ID to paper information.
+        """
+        self.add_many({topic: papers_info})
+
+    def add_many(self, topics_papers: Dict[str, Dict[str, Dict]]) -> List[str]:
+        """
+        Store the results of several topics in a single transaction.
+
+        A topic's version only moves when a paper was added to it or one of its
+        papers changed, so repeating a search leaves cached pages valid. A topic
+        whose search found nothing is skipped, it gets no row of its own.
+        args:
+        :param topics_papers: Mapping of topic to its paper ID -> paper information mapping.
+        :returns:
+         The canonical keys of the topics whose papers changed.
+        """
+        changed = []
+        with self._lock, self._conn:
+            for topic, papers_info in topics_papers.items():
+                if not papers_info:
+                    continue
+                key = topic_key(topic)
+                changes_before = self._conn.total_changes
+                self._conn.execute("INSERT OR IGNORE INTO topics(topic) VALUES (?)", (key,))
+                self._conn.execute("UPDATE topics SET display = ? WHERE topic = ? AND display IS NULL",
+                                   (display_name(topic), key))
+                self._conn.executemany(
+                    "INSERT INTO papers VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(paper_id) DO UPDATE SET title = excluded.title, authors = excluded.authors, "
+                    "summary = excluded.summary, pdf_url = excluded.pdf_url, published = excluded.published "
+                    "WHERE title IS NOT excluded.title OR authors IS NOT excluded.authors "
+                    "OR summary IS NOT excluded.summary OR pdf_url IS NOT excluded.pdf_url "
+                    "OR published IS NOT excluded.published",
+                    [
+                        (paper_id, info["title"], json.dumps(info["authors"]), info["summary"],
+                         info["pdf_url"], info["published"])
+                        for paper_id, info in papers_info.items()
+                    ],
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO topic_papers VALUES (?, ?)",
+                    [(key, paper_id) for paper_id in papers_info],
+                )
+                if self._conn.total_changes != changes_before and key not in changed:
+                    self._conn.execute("UPDATE topics SET version = version + 1 WHERE topic = ?", (key,))
+                    changed.append(key)
+        return changed
+
+    def get_paper(self, paper_id: str) -> Optional[Dict]:
+        """
+        Look up a single paper by its ID.
+        args:
+        :param paper_id: The arXiv short ID, e.g. "2208.00733v1".
+        :returns:
+         The paper information, or None if the paper is not in the catalog.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT title, authors, summary, pdf_url, published FROM papers WHERE paper_id = ?",
+                (paper_id,),
+            ).fetchone()
+        return self._row_to_info(row) if row else None
+
+    def list_topics(self) -> List[str]:
+        """
+        List all topics that have at least one paper.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT topic FROM topic_papers ORDER BY topic"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def topic_display_names(self) -> Dict[str, str]:
+        """
+        Display name of every topic that has at least one paper, keyed by its storage key.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT t.topic, COALESCE(t.display, t.topic) FROM topics t "
+                "WHERE EXISTS (SELECT 1 FROM topic_papers m WHERE m.topic = t.topic) ORDER BY t.topic"
+            ).fetchall()
+        return dict(rows)
+
+    def topic_papers(self, topic: str) -> Dict[str, Dict]:
+        """
+        Get all papers stored for a topic.
+        args:
+        :param topic: The topic to read, it is normalized with topic_key.
+        :returns:
+         Mapping of paper ID to paper information, empty if the topic is unknown.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT p.paper_id, p.title, p.authors, p.summary, p.pdf_url, p.published "
+                "FROM topic_papers t JOIN papers p ON p.paper_id = t.paper_id "
+                "WHERE t.topic = ? ORDER BY p.paper_id",
+                (topic_key(topic),),
+            ).fetchall()
+        return {row[0]: self._row_to_info(row[1:]) for row in rows}
+
+    def topic_paper_ids(self, topic: str) -> List[str]:
+        """
+        Sorted IDs of the papers in a topic, read from the membership index only.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT paper_id FROM topic_papers WHERE topic = ? ORDER BY paper_id",
+                (topic_key(topic),),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def newest_published(self, topic: str) -> Optional[str]:
+        """
+        The latest published date among the papers of a topic, None if it has no papers.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(p.published) FROM topic_papers t JOIN papers p ON p.paper_id = t.paper_id "
+                "WHERE t.topic = ?",
+                (topic_key(topic),),
+            ).fetchone()
+        return row[0]
+
+    def topic_version(self, topic: str) -> int:
+        """
+        Counter that changes every time papers are added to the topic, 0 for unknown topics.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM topics WHERE topic = ?", (topic_key(topic),)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def get_papers(self, paper_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Look up several papers with one query.
+        args:
+        :param paper_ids: The arXiv short IDs to look up.
+        :returns:
+         Mapping of paper ID to paper information for the IDs that were found.
+        """
+        found = {}
+        with self._lock:
+            # stay well below SQLite's limit on bound parameters
+            for start in range(0, len(paper_ids), 500):
+                chunk = paper_ids[start:start + 500]
+                rows = self._conn.execute(
+                    "SELECT paper_id, title, authors, summary, pdf_url, published FROM papers "
+                    f"WHERE paper_id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for row in rows:
+                    found[row[0]] = self._row_to_info(row[1:])
+        return found
+
+    def iter_papers(self) -> Iterator[Tuple[str, Dict]]:
+        """
+        Iterate over every stored paper exactly once.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT paper_id, title, authors, summary, pdf_url, published FROM papers"
+            ).fetchall()
+        for row in rows:
+            yield row[0], self._row_to_info(row[1:])
+
+    def compact_topics(self) -> Dict[str, List[str]]:
+        """
+        Fold topics stored under a non-canonical key into their canonical topic.
+
+        Papers are already stored once, so only membership rows move. Run by
+        "python paper_catalog.py compact", never implicitly.
+        returns:
+         Mapping of canonical topic to the old topic keys that were folded into it.
+        """
+        folded: Dict[str, List[str]] = {}
+        with self._lock, self._conn:
+            rows = self._conn.execute("SELECT topic, version, display FROM topics").fetchall()
+            for old_key, version, display in rows:
+                key = topic_key(old_key)
+                if key == old_key:
+                    continue
+                self._conn.execute("INSERT OR IGNORE INTO topics(topic) VALUES (?)", (key,))
+                # the old key was stored unstemmed, it still is the name to show
+                self._conn.execute("UPDATE topics SET display = ? WHERE topic = ? AND display IS NULL",
+                                   (display or display_name(old_key), key))
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO topic_papers SELECT ?, paper_id FROM topic_papers WHERE topic = ?",
+                    (key, old_key),
+                )
+                self._conn.execute("DELETE FROM topic_papers WHERE topic = ?", (old_key,))
+                self._conn.execute("DELETE FROM topics WHERE topic = ?", (old_key,))
+                # the merged topic must look changed to anyone who cached its old version
+                self._conn.execute(
+                    "UPDATE topics SET version = MAX(version, ?) + 1 WHERE topic = ?", (version, key)
+                )
+                folded.setdefault(key, []).append(old_key)
+        return folded
+
+    def migrate_json_dirs(self) -> int:
+        """
+        One-shot import of the legacy papers/<topic>/papers_info.json layout.
+
+        Existing rows are kept, so running it twice is harmless.
+        returns:
+         The number of topic directories imported.
+        """
+        imported = 0
+        for item in sorted(os.listdir(self.paper_dir)):
+            file_path = os.path.join(self.paper_dir, item, "papers_info.json")
+            if not os.path.isfile(file_path):
+                continue
+            try:
+                with open(file_path, "r") as json_file:
+                    papers_info = json.load(json_file)
+            except json.decoder.JSONDecodeError as e:
+                print(f"Error reading {file_path}: {str(e)}")
+                continue
+            self.add_papers(item, papers_info)
+            imported += 1
+        return imported
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    # usage: python paper_catalog.py migrate|compact [paper_dir]
+    # compact rewrites and deletes topic directories, stop the servers sharing paper_dir first
+    if len(sys.argv) < 2 or sys.argv[1] not in ("migrate", "compact"):
+        print("Usage: python paper_catalog.py migrate|compact [paper_dir]")
+        sys.exit(1)
+    paper_dir = sys.argv[2] if len(sys.argv) > 2 else "papers"
+    load_topic_aliases(paper_dir)
+    if sys.argv[1] == "migrate":
+        catalog = PaperCatalog(paper_dir)
+        count = catalog.migrate_json_dirs()
+        print(f"Imported {count} topic directories into {catalog.db_path}")
+        catalog.close()
+    else:
+        if os.path.exists(os.path.join(paper_dir, CATALOG_FILE)):
+            catalog = PaperCatalog(paper_dir)
+            for key, old_keys in catalog.compact_topics().items():
+                print(f"Catalog: folded {', '.join(old_keys)} into {key}")
+            catalog.close()
+        for key, items in fold_topic_dirs(paper_dir).items():
+            print(f"Directories: folded {', '.join(items) or key} into {key}")
@@ -0,0 +1,188 @@
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# odd multipliers that mix three word hashes into one shingle hash, uint64 arithmetic wraps around
+_MIX_1 = np.uint64(0x9E3779B97F4A7C15)
+_MIX_2 = np.uint64(0xC2B2AE3D27D4EB4F)
+_SHIFT = np.uint64(32)
+
+_VERSION_SUFFIX = re.compile(r"v\d+$")
+
+
+def base_id(paper_id: str) -> str:
+    """
+    arXiv ID without its version, 1310.7911v2 -> 1310.7911.
+    """
+    return _VERSION_SUFFIX.sub("", paper_id)
+
+
+def shingle_hashes(text: str) -> np.ndarray:
+    """
+    One 64 bit hash per word 3-gram of a text.
+
+    Words are hashed with Python's hash(), which is salted per process. That is
+    fine because signatures are only ever compared within one server process.
+    """
+    words = re.findall(r"\w+", text.lower())
+    hashes = np.array(list(map(hash, words)), dtype=np.int64).view(np.uint64)
+    if len(hashes) < 3:
+        return np.array([int(hashes.sum()) if len(hashes) else 0], dtype=np.uint64)
+    return hashes[:-2] * _MIX_1 + hashes[1:-1] * _MIX_2 + hashes[2:]
+
+
+class DuplicateIndex:
+    """
+    Near-duplicate detection over summaries with MinHash signatures and LSH banding.
+
+    Every summary gets a num_perm MinHash signature of its word 3-grams. The
+    signature is cut into bands, and papers that agree on all rows of at least
+    one band land in the same bucket and become candidates. Candidates whose
+    estimated Jaccard similarity reaches threshold are duplicates. An insert
+    only looks at the buckets of its own bands, so it does not get slower with
+    the size of the catalog. Versions of one arXiv paper (v1, v2, ...) are
+    always duplicates of each other. Duplicates are merged into groups with
+    union-find, and groups only grow until the next start rebuilds the index.
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, threshold: float = 0.8, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        # multiply-shift hash functions (a * x + b) >> 32 with odd a, one per permutation
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+
+        self._lock = threading.Lock()
+        self._buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._by_base: Dict[str, List[str]] = {}
+        self._parent: Dict[str, str] = {}
+        # moves whenever a group changes, for caches of collapsed lists
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingle_hashes(text)
+        return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) >> _SHIFT).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [band.tobytes() for band in signature.reshape(self.bands, self.rows)]
+
+    def _find(self, paper_id: str) -> str:
+        root = paper_id
+        while self._parent.get(root, root) != root:
+            root = self._parent[root]
+        # path compression
+        while paper_id != root:
+            self._parent[paper_id], paper_id = root, self._parent[paper_id]
+        return root
+
+    def _union(self, first: str, second: str) -> None:
+        first_root, second_root = self._find(first), self._find(second)
+        if first_root != second_root:
+            self._parent[max(first_root, second_root)] = min(first_root, second_root)
+            self.generation += 1
+
+    def _candidates(self, paper_id: str, signature: np.ndarray,
+                    band_keys: Optional[List[bytes]] = None) -> List[Tuple[str, float]]:
+        seen = {paper_id}
+        found = []
+        for band, key in enumerate(band_keys or self._band_keys(signature)):
+            for other in self._buckets[band].get(key, ()):
+                if other in seen:
+                    continue
+                seen.add(other)
+                similarity = float(np.mean(self._signatures[other] == signature))
+                if similarity >= self.threshold:
+                    found.append((other, round(similarity, 3)))
+        return found
+
+    def add_papers(self, papers: Iterable[Tuple[str, Dict]]) -> int:
+        """
+        Index the summaries of new papers and of papers whose summary changed.
+        args:
+        :param papers: (paper ID, paper information) pairs.
+        :returns:
+         The number of summaries that were indexed.
+        """
+        indexed = 0
+        for paper_id, paper_info in papers:
+            # the signature is computed outside the lock, it is the expensive part
+            signature = self.signature(paper_info["summary"])
+            with self._lock:
+                old = self._signatures.get(paper_id)
+                if old is not None:
+                    if np.array_equal(old, signature):
+                        continue
+                    for band, key in enumerate(self._band_keys(old)):
+                        self._buckets[band][key].remove(paper_id)
+                self._signatures[paper_id] = signature
+                band_keys = self._band_keys(signature)
+                for band, key in enumerate(band_keys):
+                    self._buckets[band].setdefault(key, []).append(paper_id)
+                versions = self._by_base.setdefault(base_id(paper_id), [])
+                if paper_id not in versions:
+                    versions.append(paper_id)
+                for other in versions:
+                    self._union(paper_id, other)
+                for other, _ in self._candidates(paper_id, signature, band_keys):
+                    self._union(paper_id, other)
+                indexed += 1
+        return indexed
+
+    def duplicates_of(self, paper_id: str) -> Optional[List[Tuple[str, float]]]:
+        """
+        Near-duplicates of one paper with their estimated similarity, None if the paper is unknown.
+        Other versions of the same arXiv paper are always included.
+        """
+        with self._lock:
+            signature = self._signatures.get(paper_id)
+            if signature is None:
+                return None
+            found = dict(self._candidates(paper_id, signature))
+            for other in self._by_base.get(base_id(paper_id), ()):
+                if other != paper_id and other not in found:
+                    found[other] = round(float(np.mean(self._signatures[other] == signature)), 3)
+        return sorted(found.items(), key=lambda item: -item[1])
+
+    def groups(self) -> List[List[str]]:
+        """
+        All groups of two or more duplicates, largest first.
+        """
+        with self._lock:
+            members: Dict[str, List[str]] = {}
+            # roots only show up as values of _parent
+            for paper_id in set(self._parent) | set(self._parent.values()):
+                members.setdefault(self._find(paper_id), []).append(paper_id)
+        return sorted((sorted(group) for group in members.values() if len(group) > 1),
+                      key=lambda group: (-len(group), group[0]))
+
+    def collapse(self, paper_ids: Iterable[str], k: Optional[int] = None) -> List[Tuple[str, List[str]]]:
+        """
+        Keep the first paper of every duplicate group in a list.
+        args:
+        :param paper_ids: Paper IDs in the order they should be shown, may be a lazy iterator.
+        :param k: Stop reading paper_ids at the first paper that would start group k + 1.
+        :returns:
+         (kept paper ID, IDs of its duplicates that were dropped from the list) pairs, in list order.
+        """
+        kept: Dict[str, Tuple[str, List[str]]] = {}
+        with self._lock:
+            for paper_id in paper_ids:
+                root = self._find(paper_id)
+                if root in kept:
+                    kept[root][1].append(paper_id)
+                elif k is not None and len(kept) >= k:
+                    break
+                else:
+                    kept[root] = (paper_id, [])
+        return list(kept.values())
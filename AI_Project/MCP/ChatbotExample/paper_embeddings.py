@@ -0,0 +1,277 @@
+import fcntl
+import hashlib
+import importlib
+import json
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+EMBEDDINGS_DIR = "_embeddings"
+VECTORS_FILE = "vectors.f16"
+IDS_FILE = "ids.jsonl"
+META_FILE = "meta.json"
+LOCK_FILE = ".lock"
+
+
+class Embedder(ABC):
+    """
+    Turns texts into fixed size vectors. name identifies the model so vectors
+    of different embedders are never mixed in one matrix.
+    """
+
+    name = "embedder"
+    dim = 0
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        ...
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic offline embedder: signed feature hashing of words and word bigrams.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = re.findall(r"\w+", text.lower())
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                vectors[row, value % self.dim] += 1.0 if value >> 63 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+def embedder_from_env() -> Embedder:
+    """
+    EMBEDDER=package.module:factory plugs in another embedder, the default is HashingEmbedder.
+    """
+    spec = os.environ.get("EMBEDDER")
+    if not spec:
+        return HashingEmbedder()
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr)()
+
+
+def _digest(summary: str) -> str:
+    return hashlib.sha1(summary.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Summary embeddings kept in a memory-mapped float16 matrix.
+
+    Row i of papers/_embeddings/vectors.f16 belongs to the paper on row i of
+    ids.jsonl. The ID file is append-only, a changed summary rewrites its row
+    in place and appends a line with the new digest. Vectors are unit length,
+    so a similarity query is one matrix-vector product plus argpartition.
+
+    Several server processes may share papers/, like the journal the store
+    is kept consistent with flock on papers/_embeddings/.lock. Writers take
+    it exclusively and read the ID lines other processes appended before
+    they assign rows, queries read them under a shared lock first.
+    """
+
+    def __init__(self, paper_dir: str, embedder: Embedder, batch_size: int = 64):
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.dir = os.path.join(paper_dir, EMBEDDINGS_DIR)
+        os.makedirs(self.dir, exist_ok=True)
+        self._lock = threading.Lock()
+
+        self.paper_ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._digests: Dict[str, str] = {}
+        self._matrix: Optional[np.memmap] = None
+        # bytes of ids.jsonl read so far
+        self._ids_offset = 0
+
+        meta_path = os.path.join(self.dir, META_FILE)
+        expected_meta = {"embedder": embedder.name, "dim": embedder.dim}
+        with self._flock(exclusive=True):
+            meta = None
+            if os.path.exists(meta_path):
+                with open(meta_path, "r") as meta_file:
+                    meta = json.load(meta_file)
+                if meta != expected_meta:
+                    # another embedder produced these vectors, start over
+                    for name in (VECTORS_FILE, IDS_FILE):
+                        if os.path.exists(os.path.join(self.dir, name)):
+                            os.remove(os.path.join(self.dir, name))
+            if meta != expected_meta:
+                tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as meta_file:
+                    json.dump(expected_meta, meta_file)
+                os.replace(tmp_path, meta_path)
+
+            self._refresh_locked()
+            self._open_matrix(max(len(self.paper_ids), 1024))
+
+    def __len__(self) -> int:
+        return len(self.paper_ids)
+
+    @contextmanager
+    def _flock(self, exclusive: bool):
+        with open(os.path.join(self.dir, LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh_locked(self) -> None:
+        """
+        Read the ID lines appended since the last call, the flock is already held.
+
+        The rows are rebuilt from the start when another process reset the store.
+        """
+        ids_path = os.path.join(self.dir, IDS_FILE)
+        ids_size = os.path.getsize(ids_path) if os.path.exists(ids_path) else 0
+        if ids_size < self._ids_offset:
+            self.paper_ids = []
+            self._rows = {}
+            self._digests = {}
+            self._ids_offset = 0
+        if ids_size > self._ids_offset:
+            with open(ids_path, "rb") as ids_file:
+                ids_file.seek(self._ids_offset)
+                tail = ids_file.read(ids_size - self._ids_offset)
+            complete = tail[:tail.rfind(b"\n") + 1]
+            for line in complete.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record["id"] not in self._rows:
+                    self._rows[record["id"]] = len(self.paper_ids)
+                    self.paper_ids.append(record["id"])
+                self._digests[record["id"]] = record["digest"]
+            self._ids_offset += len(complete)
+        if self._matrix is not None:
+            self._open_matrix(len(self.paper_ids))
+
+    def _refresh(self) -> None:
+        # must be called with self._lock held
+        with self._flock(exclusive=False):
+            self._refresh_locked()
+
+    def _open_matrix(self, min_rows: int) -> None:
+        """
+        Map the vector file, growing it to at least min_rows rows.
+        """
+        if self._matrix is not None and self._matrix.shape[0] >= min_rows:
+            return
+        path = os.path.join(self.dir, VECTORS_FILE)
+        row_bytes = self.embedder.dim * np.dtype(np.float16).itemsize
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        capacity = size // row_bytes
+        if capacity < min_rows:
+            # double so that growing stays amortized O(1) per paper
+            capacity = max(min_rows, capacity * 2)
+            if self._matrix is not None:
+                self._matrix.flush()
+                self._matrix = None
+            with open(path, "ab") as vectors_file:
+                vectors_file.truncate(capacity * row_bytes)
+        self._matrix = np.memmap(path, dtype=np.float16, mode="r+", shape=(capacity, self.embedder.dim))
+
+    def add_papers(self, papers: Iterable[Tuple[str, Dict]]) -> int:
+        """
+        Embed new papers and papers whose summary changed, in batches.
+        args:
+        :param papers: (paper ID, paper information) pairs.
+        :returns:
+         The number of summaries that were embedded.
+        """
+        papers = list(papers)
+        with self._lock:
+            self._refresh()
+            pending = [
+                (paper_id, paper_info["summary"]) for paper_id, paper_info in papers
+                if self._digests.get(paper_id) != _digest(paper_info["summary"])
+            ]
+        if not pending:
+            return 0
+
+        # embedding may be slow, it runs without the file lock so other processes can go on
+        embedded = []
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            vectors = self.embedder.embed([summary for _, summary in batch])
+            embedded.extend((paper_id, _digest(summary), vector) for (paper_id, summary), vector in zip(batch, vectors))
+
+        with self._lock, self._flock(exclusive=True):
+            # rows are assigned from the ID file as it is now, not as it was before embedding
+            self._refresh_locked()
+            embedded = [(paper_id, digest, vector) for paper_id, digest, vector in embedded
+                        if self._digests.get(paper_id) != digest]
+            if not embedded:
+                return 0
+            new_ids = {paper_id for paper_id, _, _ in embedded if paper_id not in self._rows}
+            self._open_matrix(len(self.paper_ids) + len(new_ids))
+
+            records = []
+            for paper_id, digest, vector in embedded:
+                if paper_id not in self._rows:
+                    self._rows[paper_id] = len(self.paper_ids)
+                    self.paper_ids.append(paper_id)
+                self._matrix[self._rows[paper_id]] = vector
+                self._digests[paper_id] = digest
+                records.append(json.dumps({"id": paper_id, "digest": digest}) + "\n")
+            # vectors first, so an ID line never points at a row that was not written
+            self._matrix.flush()
+            data = "".join(records).encode("utf-8")
+            with open(os.path.join(self.dir, IDS_FILE), "ab") as ids_file:
+                ids_file.write(data)
+            self._ids_offset += len(data)
+            return len(embedded)
+
+    def _top_k(self, query: np.ndarray, k: int, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        count = len(self.paper_ids)
+        if count == 0:
+            return []
+        query = query.astype(np.float32)
+        scores = np.empty(count, dtype=np.float32)
+        # convert float16 rows in chunks so the whole matrix is never copied at once
+        for start in range(0, count, 65536):
+            stop = min(start + 65536, count)
+            scores[start:stop] = self._matrix[start:stop].astype(np.float32) @ query
+        if exclude is not None and exclude in self._rows:
+            scores[self._rows[exclude]] = -np.inf
+            count -= 1
+        k = min(k, count)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.paper_ids[row], round(float(scores[row]), 4)) for row in top]
+
+    def similar_to_text(self, text: str, k: int = 5) -> List[Tuple[str, float]]:
+        """
+        Papers whose summary is closest to a free text, best first.
+        """
+        query = self.embedder.embed([text])[0]
+        with self._lock, self._flock(exclusive=False):
+            self._refresh_locked()
+            return self._top_k(query, k)
+
+    def similar_to_paper(self, paper_id: str, k: int = 5) -> Optional[List[Tuple[str, float]]]:
+        """
+        Papers whose summary is closest to the summary of a stored paper, None if it is unknown.
+        """
+        with self._lock, self._flock(exclusive=False):
+            self._refresh_locked()
+            row = self._rows.get(paper_id)
+            if row is None:
+                return None
+            return self._top_k(np.array(self._matrix[row]), k, exclude=paper_id)
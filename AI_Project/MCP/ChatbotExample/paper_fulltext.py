@@ -0,0 +1,185 @@
+import hashlib
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import threading
+import urllib.request
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional
+
+FULLTEXT_DIR = "_fulltext"
+
+
+def _safe_name(paper_id: str) -> str:
+    # old style IDs such as math/9711204v1 contain a slash
+    return paper_id.replace("/", "_")
+
+
+def extract_pdf_text(pdf_path: str) -> str:
+    """
+    Extract the text of a PDF file. Runs in a worker process, so it must stay a module level function.
+    """
+    from pypdf import PdfReader
+    reader = PdfReader(pdf_path)
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def _init_extract_worker() -> None:
+    """
+    Set up a text extraction worker process.
+
+    stdout of a stdio server is its MCP channel: the worker's goes to stderr,
+    so it can neither write into the channel nor keep it open. A server that
+    is killed never shuts its pool down, a watcher thread ends the worker
+    when its parent is gone instead of leaving it waiting for work forever.
+    """
+    sys.stdout.flush()
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+
+    def exit_with_parent():
+        multiprocessing.connection.wait([multiprocessing.parent_process().sentinel])
+        os._exit(0)
+
+    threading.Thread(target=exit_with_parent, name="parent-watch", daemon=True).start()
+
+
+class Downloader(ABC):
+    """
+    Fetches the bytes behind a URL.
+    """
+
+    @abstractmethod
+    def fetch(self, url: str) -> bytes:
+        ...
+
+
+class HttpDownloader(Downloader):
+    def __init__(self, timeout: float = 60):
+        self.timeout = timeout
+
+    def fetch(self, url: str) -> bytes:
+        request = urllib.request.Request(url, headers={"User-Agent": "research-mcp-server"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return response.read()
+
+
+class LocalDownloader(Downloader):
+    """
+    Stand-in for arXiv in tests: serves <root>/<paper id>.pdf for .../pdf/<paper id> URLs.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def fetch(self, url: str) -> bytes:
+        paper_id = url.split("/pdf/", 1)[-1]
+        with open(os.path.join(self.root, _safe_name(paper_id) + ".pdf"), "rb") as pdf_file:
+            return pdf_file.read()
+
+
+def downloader_from_env() -> Downloader:
+    """
+    FULLTEXT_SOURCE=local:<dir> serves PDFs from a local directory instead of arXiv.
+    """
+    spec = os.environ.get("FULLTEXT_SOURCE", "arxiv")
+    if spec.startswith("local:"):
+        return LocalDownloader(spec[len("local:"):])
+    return HttpDownloader()
+
+
+class FulltextStore:
+    """
+    Downloads paper PDFs and caches their extracted text.
+
+    PDFs are stored content-addressed under papers/_fulltext/blobs/<sha256>.pdf,
+    extracted text under papers/_fulltext/text/<paper id>.txt. arXiv IDs carry
+    their version, so the text cache is keyed by ID and version and never goes
+    stale. Downloads run on a bounded thread pool, text extraction on a process
+    pool because it is CPU bound. Its workers are spawned rather than forked:
+    the server has threads, and a forked child can inherit a lock one of them
+    held and deadlock on it.
+    """
+
+    def __init__(self, paper_dir: str, downloader: Downloader,
+                 download_workers: int = 4, extract_workers: int = 2):
+        self.downloader = downloader
+        self.blob_dir = os.path.join(paper_dir, FULLTEXT_DIR, "blobs")
+        self.text_dir = os.path.join(paper_dir, FULLTEXT_DIR, "text")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.text_dir, exist_ok=True)
+        self.download_pool = ThreadPoolExecutor(max_workers=download_workers, thread_name_prefix="download")
+        self.extract_workers = extract_workers
+        self._extract_pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _text_path(self, paper_id: str) -> str:
+        return os.path.join(self.text_dir, _safe_name(paper_id) + ".txt")
+
+    def _get_extract_pool(self) -> ProcessPoolExecutor:
+        # started on first use so a server that never fetches full text has no extra processes
+        with self._lock:
+            if self._extract_pool is None:
+                self._extract_pool = ProcessPoolExecutor(max_workers=self.extract_workers,
+                                                         mp_context=multiprocessing.get_context("spawn"),
+                                                         initializer=_init_extract_worker)
+            return self._extract_pool
+
+    def _download(self, url: str) -> str:
+        data = self.downloader.fetch(url)
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = os.path.join(self.blob_dir, digest + ".pdf")
+        if not os.path.exists(blob_path):
+            tmp_path = blob_path + f".{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as blob_file:
+                blob_file.write(data)
+            os.replace(tmp_path, blob_path)
+        return blob_path
+
+    def cached_text(self, paper_id: str) -> Optional[str]:
+        try:
+            with open(self._text_path(paper_id), "r", encoding="utf-8") as text_file:
+                return text_file.read()
+        except FileNotFoundError:
+            return None
+
+    def fetch(self, pdf_urls: Dict[str, str]) -> Dict[str, Dict]:
+        """
+        Get the full text of several papers, downloading and extracting only what is not cached.
+        args:
+        :param pdf_urls: Mapping of paper ID to its PDF URL.
+        :returns:
+         Mapping of paper ID to {"status": "cached" | "fetched" | "error", "text" or "error": ...}.
+        """
+        results: Dict[str, Dict] = {}
+        downloads = {}
+        for paper_id, url in pdf_urls.items():
+            text = self.cached_text(paper_id)
+            if text is not None:
+                results[paper_id] = {"status": "cached", "text": text}
+            else:
+                downloads[paper_id] = self.download_pool.submit(self._download, url)
+
+        extractions = {}
+        for paper_id, future in downloads.items():
+            try:
+                blob_path = future.result()
+            except Exception as e:
+                results[paper_id] = {"status": "error", "error": f"download failed: {e}"}
+                continue
+            extractions[paper_id] = self._get_extract_pool().submit(extract_pdf_text, blob_path)
+
+        for paper_id, future in extractions.items():
+            try:
+                text = future.result()
+            except Exception as e:
+                results[paper_id] = {"status": "error", "error": f"text extraction failed: {e}"}
+                continue
+            text_path = self._text_path(paper_id)
+            with open(text_path + ".tmp", "w", encoding="utf-8") as text_file:
+                text_file.write(text)
+            os.replace(text_path + ".tmp", text_path)
+            results[paper_id] = {"status": "fetched", "text": text}
+        return results
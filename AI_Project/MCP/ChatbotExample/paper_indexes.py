@@ -0,0 +1,217 @@
+import bisect
+import datetime
+import re
+import threading
+import unicodedata
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+
+def normalize_author(name: str) -> str:
+    """
+    Normalize an author name for lookups: accents, case, punctuation and "Last, First" order do not matter.
+    """
+    if "," in name:
+        last, _, first = name.partition(",")
+        name = f"{first} {last}"
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(ch for ch in name if not unicodedata.combining(ch)).casefold()
+    return " ".join(re.findall(r"\w+", name))
+
+
+def author_keys(name: str) -> List[str]:
+    """
+    Index keys of an author: the full normalized name and "first initial + last name".
+
+    The second key lets "A. Turing" find "Alan Turing" and "Alan M. Turing".
+    """
+    words = normalize_author(name).split()
+    if not words:
+        return []
+    keys = [" ".join(words)]
+    if len(words) > 1:
+        short = f"{words[0][0]} {words[-1]}"
+        if short != keys[0]:
+            keys.append(short)
+    return keys
+
+
+_DATE_PREFIX = re.compile(r"\d{4}(-(0[1-9]|1[0-2])(-\d{2})?)?")
+
+
+def valid_date_prefix(value: str) -> bool:
+    """
+    Whether value is a date or date prefix the date indexes understand: YYYY, YYYY-MM or YYYY-MM-DD.
+    """
+    if not _DATE_PREFIX.fullmatch(value):
+        return False
+    if len(value) == 10:
+        try:
+            datetime.date.fromisoformat(value)
+        except ValueError:
+            return False
+    return True
+
+
+class _SortedPairs:
+    """
+    (published, paper ID) pairs kept in sorted order, so date ranges are two bisects.
+    """
+
+    def __init__(self):
+        self.pairs: List[Tuple[str, str]] = []
+
+    def add(self, published: str, paper_id: str) -> None:
+        pair = (published, paper_id)
+        index = bisect.bisect_left(self.pairs, pair)
+        if index == len(self.pairs) or self.pairs[index] != pair:
+            self.pairs.insert(index, pair)
+
+    def remove(self, published: str, paper_id: str) -> None:
+        pair = (published, paper_id)
+        index = bisect.bisect_left(self.pairs, pair)
+        if index < len(self.pairs) and self.pairs[index] == pair:
+            del self.pairs[index]
+
+    def _bounds(self, start: str, end: str, after: Optional[Tuple[str, str]] = None) -> Tuple[int, int]:
+        # end + "\uffff" sorts after every date it is a prefix of, so "2023" covers all of 2023
+        low = bisect.bisect_left(self.pairs, (start,))
+        if after is not None:
+            low = max(low, bisect.bisect_right(self.pairs, after))
+        high = bisect.bisect_right(self.pairs, (end + "\uffff",))
+        return low, high
+
+    def count_between(self, start: str, end: str) -> int:
+        low, high = self._bounds(start, end)
+        return max(high - low, 0)
+
+    def between(self, start: str, end: str, after: Optional[Tuple[str, str]] = None,
+                limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        low, high = self._bounds(start, end, after)
+        if limit is not None:
+            high = min(high, low + limit)
+        return self.pairs[low:high]
+
+    def newest(self, k: int) -> List[Tuple[str, str]]:
+        return self.pairs[-k:][::-1] if k > 0 else []
+
+
+class PaperIndexes:
+    """
+    In-memory author and publication date indexes over the catalog.
+
+    Every author key maps to that author's papers sorted by date, the whole
+    catalog and every topic have one date-sorted list each. Lookups are a dict
+    access or two bisects, plus the size of the answer. The indexes are built
+    from the catalog at startup and kept up to date on ingest like the search
+    index and the embeddings.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._papers: Dict[str, Tuple[str, List[str]]] = {}
+        self._by_author: Dict[str, _SortedPairs] = {}
+        self._by_date = _SortedPairs()
+        self._by_topic_date: Dict[str, _SortedPairs] = {}
+        self._topics: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._papers)
+
+    def _unindex(self, paper_id: str) -> None:
+        published, keys = self._papers.pop(paper_id)
+        self._by_date.remove(published, paper_id)
+        for key in keys:
+            self._by_author[key].remove(published, paper_id)
+        for topic in self._topics.get(paper_id, ()):
+            self._by_topic_date[topic].remove(published, paper_id)
+
+    def add_papers(self, papers: Iterable[Tuple[str, Dict]], topic: Optional[str] = None) -> None:
+        """
+        Index new papers and re-index papers whose date or authors changed.
+        args:
+        :param papers: (paper ID, paper information) pairs.
+        :param topic: Canonical key of the topic the papers belong to, if known.
+        """
+        with self._lock:
+            for paper_id, paper_info in papers:
+                published = paper_info["published"]
+                keys = sorted({key for author in paper_info["authors"] for key in author_keys(author)})
+                if self._papers.get(paper_id) != (published, keys):
+                    if paper_id in self._papers:
+                        self._unindex(paper_id)
+                    self._papers[paper_id] = (published, keys)
+                    self._by_date.add(published, paper_id)
+                    for key in keys:
+                        self._by_author.setdefault(key, _SortedPairs()).add(published, paper_id)
+                    for known_topic in self._topics.get(paper_id, ()):
+                        self._by_topic_date[known_topic].add(published, paper_id)
+                if topic is not None and topic not in self._topics.setdefault(paper_id, set()):
+                    self._topics[paper_id].add(topic)
+                    self._by_topic_date.setdefault(topic, _SortedPairs()).add(published, paper_id)
+
+    def add_topic_members(self, topic: str, paper_ids: Iterable[str]) -> None:
+        """
+        Record already indexed papers as members of a topic, used when building from the catalog.
+        """
+        with self._lock:
+            topic_pairs = self._by_topic_date.setdefault(topic, _SortedPairs())
+            for paper_id in paper_ids:
+                if paper_id in self._papers and topic not in self._topics.setdefault(paper_id, set()):
+                    self._topics[paper_id].add(topic)
+                    topic_pairs.add(self._papers[paper_id][0], paper_id)
+
+    def by_author(self, name: str, k: int = 20) -> List[Tuple[str, str]]:
+        """
+        Papers of an author, newest first.
+        args:
+        :param name: The author name in any of the forms normalize_author accepts.
+        :param k: The maximum number of papers.
+        :returns:
+         (paper ID, published) pairs.
+        """
+        keys = author_keys(name)
+        if not keys:
+            return []
+        with self._lock:
+            # the full name is exact, an unknown full name falls back to "first initial + last name"
+            pairs = self._by_author.get(keys[0])
+            if pairs is None and len(keys) > 1:
+                pairs = self._by_author.get(keys[1])
+            newest = pairs.newest(k) if pairs else []
+        return [(paper_id, published) for published, paper_id in newest]
+
+    def count_between(self, start: str, end: str, topic: Optional[str] = None) -> int:
+        """
+        The number of papers published from start to end, from the bisect bounds alone.
+        """
+        with self._lock:
+            pairs = self._by_date if topic is None else self._by_topic_date.get(topic)
+            return pairs.count_between(start, end) if pairs else 0
+
+    def between(self, start: str, end: str, topic: Optional[str] = None,
+                chunk: int = 256) -> Iterator[Tuple[str, str]]:
+        """
+        Papers published from start to end, both inclusive, oldest first.
+
+        The range is read lazily, chunk pairs per lock, so a caller that only
+        needs the first few papers of a large range never copies all of it.
+        Every chunk continues after the last pair handed out, papers indexed
+        in between are picked up if they sort after it.
+        args:
+        :param start: ISO date or date prefix, "2023" and "2023-06" work too.
+        :param end: ISO date or date prefix, a prefix covers the whole year or month.
+        :param topic: Canonical topic key to restrict the range to.
+        :param chunk: The number of pairs copied per lock.
+        :returns:
+         An iterator of (paper ID, published) pairs.
+        """
+        last = None
+        while True:
+            with self._lock:
+                pairs = self._by_date if topic is None else self._by_topic_date.get(topic)
+                found = pairs.between(start, end, after=last, limit=chunk) if pairs else []
+            for published, paper_id in found:
+                yield paper_id, published
+            if len(found) < chunk:
+                return
+            last = found[-1]
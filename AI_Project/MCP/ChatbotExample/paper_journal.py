@@ -0,0 +1,413 @@
+import fcntl
+import json
+import os
+import threading
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from paper_catalog import (DISPLAY_FILE, display_name, duplicate_topic_dirs, fold_topic_dirs, read_topic_version,
+                           topic_key, write_topic_version)
+
+CHECKPOINT_FILE = "papers_info.json"
+JOURNAL_FILE = "journal.jsonl"
+LOCK_FILE = ".lock"
+
+
+class _TopicView:
+    """In-memory merged view of one topic: the checkpoint plus the journal tail read so far."""
+
+    def __init__(self):
+        self.papers: Dict[str, Dict] = {}
+        self.checkpoint_stamp: Optional[Tuple[int, int]] = None
+        self.journal_offset = 0
+        self.journal_entries = 0
+
+
+class JournalCatalog:
+    """
+    File based paper store with the same interface as PaperCatalog.
+
+    Every topic keeps the familiar papers/<topic>/papers_info.json, which is now
+    only a compaction checkpoint, plus an append-only journal.jsonl. search_papers
+    appends one line per new paper instead of rewriting the whole topic, a
+    background thread fsyncs dirty journals in batches and another one folds
+    long journals back into the checkpoint. All file access is serialized
+    across processes with flock on papers/<topic>/.lock. The version of a
+    topic lives in papers/<topic>/version and is bumped with every append,
+    so it means the same in every process and survives restarts.
+    """
+
+    def __init__(self, paper_dir: str, fsync_interval: float = 0.5,
+                 compact_threshold: int = 1000, compact_interval: float = 30.0):
+        self.paper_dir = paper_dir
+        os.makedirs(paper_dir, exist_ok=True)
+        self.compact_threshold = compact_threshold
+
+        self._lock = threading.RLock()
+        self._views: Dict[str, _TopicView] = {}
+        self._journals: Dict[str, object] = {}
+        self._dirty: set = set()
+        self._id_topics: Dict[str, str] = {}
+        self._indexed = False
+
+        self._stop = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._run_every, args=(fsync_interval, self.flush), daemon=True),
+            threading.Thread(target=self._run_every, args=(compact_interval, self.compact), daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # ---- file helpers -------------------------------------------------
+
+    def _path(self, key: str, name: str) -> str:
+        return os.path.join(self.paper_dir, key, name)
+
+    @contextmanager
+    def _flock(self, key: str, exclusive: bool):
+        os.makedirs(os.path.join(self.paper_dir, key), exist_ok=True)
+        with open(self._path(key, LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _checkpoint_stamp(self, key: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self._path(key, CHECKPOINT_FILE))
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def _run_every(self, interval: float, fn) -> None:
+        while not self._stop.wait(interval):
+            try:
+                fn()
+            except Exception as e:
+                print(f"Journal background task failed: {e}")
+
+    # ---- merged view --------------------------------------------------
+
+    def _refresh(self, key: str) -> _TopicView:
+        """
+        Bring the in-memory view of a topic up to date under a shared lock.
+        Must be called with self._lock held.
+        """
+        with self._flock(key, exclusive=False):
+            return self._refresh_locked(key)
+
+    def _refresh_locked(self, key: str) -> _TopicView:
+        """
+        Bring the in-memory view of a topic up to date, the topic flock is already held.
+
+        Only the journal bytes appended since the last call are parsed. The view
+        is rebuilt from the checkpoint when another process compacted the topic.
+        """
+        view = self._views.setdefault(key, _TopicView())
+        stamp = self._checkpoint_stamp(key)
+        journal_path = self._path(key, JOURNAL_FILE)
+        journal_size = os.path.getsize(journal_path) if os.path.exists(journal_path) else 0
+        if stamp != view.checkpoint_stamp or journal_size < view.journal_offset:
+            view.papers = {}
+            view.journal_offset = 0
+            view.journal_entries = 0
+            view.checkpoint_stamp = stamp
+            if stamp is not None:
+                try:
+                    with open(self._path(key, CHECKPOINT_FILE), "r") as json_file:
+                        view.papers = json.load(json_file)
+                    for paper_id in view.papers:
+                        self._id_topics.setdefault(paper_id, key)
+                except json.decoder.JSONDecodeError as e:
+                    print(f"Error reading checkpoint of {key}: {str(e)}")
+        if journal_size > view.journal_offset:
+            with open(journal_path, "rb") as journal:
+                journal.seek(view.journal_offset)
+                tail = journal.read(journal_size - view.journal_offset)
+            # a writer may be in the middle of a line, keep it for next time
+            complete = tail[:tail.rfind(b"\n") + 1]
+            for line in complete.splitlines():
+                if line.strip():
+                    record = json.loads(line)
+                    view.papers[record["id"]] = record["info"]
+                    view.journal_entries += 1
+                    self._id_topics.setdefault(record["id"], key)
+            view.journal_offset += len(complete)
+        return view
+
+    def _topic_keys(self) -> List[str]:
+        keys = []
+        for item in sorted(os.listdir(self.paper_dir)):
+            if (os.path.isfile(self._path(item, CHECKPOINT_FILE))
+                    or os.path.isfile(self._path(item, JOURNAL_FILE))):
+                keys.append(item)
+        return keys
+
+    def _refresh_all(self) -> None:
+        for key in self._topic_keys():
+            self._refresh(key)
+        self._indexed = True
+
+    # ---- catalog interface ---------------------------------------------
+
+    def add_papers(self, topic: str, papers_info: Dict[str, Dict]) -> None:
+        """
+        Append papers to the journal of a topic.
+        args:
+        :param topic: The topic the papers were found for.
+        :param papers_info: Mapping of paper ID to paper information.
+        """
+        self.add_many({topic: papers_info})
+
+    def add_many(self, topics_papers: Dict[str, Dict[str, Dict]]) -> List[str]:
+        """
+        Append the results of several topics while holding all of their locks.
+
+        The locks are taken in sorted order so two processes writing overlapping
+        batches cannot deadlock, and readers never see half of a batch.
+        args:
+        :param topics_papers: Mapping of topic to its paper ID -> paper information mapping.
+        :returns:
+         The canonical keys of the topics whose papers changed.
+        """
+        changed = []
+        merged: Dict[str, Dict[str, Dict]] = {}
+        displays: Dict[str, str] = {}
+        for topic, papers_info in topics_papers.items():
+            if not papers_info:
+                # nothing found, no directory for it
+                continue
+            merged.setdefault(topic_key(topic), {}).update(papers_info)
+            displays.setdefault(topic_key(topic), display_name(topic))
+
+        with self._lock, ExitStack() as stack:
+            for key in sorted(merged):
+                stack.enter_context(self._flock(key, exclusive=True))
+            for key, papers_info in merged.items():
+                view = self._refresh_locked(key)
+                new_lines = [
+                    json.dumps({"id": paper_id, "info": info}) + "\n"
+                    for paper_id, info in papers_info.items()
+                    if view.papers.get(paper_id) != info
+                ]
+                if not new_lines:
+                    continue
+                journal = self._journals.get(key)
+                if journal is None:
+                    journal = open(self._path(key, JOURNAL_FILE), "a")
+                    self._journals[key] = journal
+                journal.write("".join(new_lines))
+                journal.flush()
+                topic_path = os.path.join(self.paper_dir, key)
+                write_topic_version(topic_path, (read_topic_version(topic_path) or 1) + 1)
+                if not os.path.isfile(self._path(key, DISPLAY_FILE)):
+                    with open(self._path(key, DISPLAY_FILE), "w") as display_file:
+                        display_file.write(displays[key])
+                self._dirty.add(key)
+                self._refresh_locked(key)
+                changed.append(key)
+        return changed
+
+    def get_paper(self, paper_id: str) -> Optional[Dict]:
+        """
+        Look up a single paper by its ID.
+        args:
+        :param paper_id: The arXiv short ID, e.g. "2208.00733v1".
+        :returns:
+         The paper information, or None if no topic contains the paper.
+        """
+        with self._lock:
+            if not self._indexed:
+                self._refresh_all()
+            key = self._id_topics.get(paper_id)
+            if key is None:
+                # another process may have added it since we last looked
+                self._refresh_all()
+                key = self._id_topics.get(paper_id)
+            if key is None:
+                return None
+            return self._refresh(key).papers.get(paper_id)
+
+    def list_topics(self) -> List[str]:
+        """
+        List all topics that have at least one paper.
+        """
+        with self._lock:
+            return [key for key in self._topic_keys() if self._refresh(key).papers]
+
+    def topic_display_names(self) -> Dict[str, str]:
+        """
+        Display name of every topic that has at least one paper, keyed by its storage key.
+        """
+        names = {}
+        for key in self.list_topics():
+            try:
+                with open(self._path(key, DISPLAY_FILE), "r") as display_file:
+                    names[key] = display_file.read().strip() or key
+            except FileNotFoundError:
+                names[key] = key
+        return names
+
+    def topic_papers(self, topic: str) -> Dict[str, Dict]:
+        """
+        Get all papers stored for a topic.
+        args:
+        :param topic: The topic to read, it is normalized with topic_key.
+        :returns:
+         Mapping of paper ID to paper information, empty if the topic is unknown.
+        """
+        key = topic_key(topic)
+        with self._lock:
+            if not os.path.isdir(os.path.join(self.paper_dir, key)):
+                return {}
+            return dict(sorted(self._refresh(key).papers.items()))
+
+    def topic_paper_ids(self, topic: str) -> List[str]:
+        """
+        Sorted IDs of the papers in a topic.
+        """
+        return list(self.topic_papers(topic))
+
+    def newest_published(self, topic: str) -> Optional[str]:
+        """
+        The latest published date among the papers of a topic, None if it has no papers.
+        """
+        key = topic_key(topic)
+        with self._lock:
+            if not os.path.isdir(os.path.join(self.paper_dir, key)):
+                return None
+            papers = self._refresh(key).papers
+            return max((info["published"] for info in papers.values()), default=None)
+
+    def topic_version(self, topic: str) -> int:
+        """
+        Counter that changes every time the papers of the topic change, 0 for unknown topics.
+
+        Topics written before the version file existed count as version 1.
+        """
+        key = topic_key(topic)
+        topic_path = os.path.join(self.paper_dir, key)
+        with self._lock:
+            if not os.path.isdir(topic_path):
+                return 0
+            with self._flock(key, exclusive=False):
+                version = read_topic_version(topic_path)
+                if version is None:
+                    version = 1 if self._refresh_locked(key).papers else 0
+            return version
+
+    def get_papers(self, paper_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Look up several papers, refreshing the ID index at most once.
+        args:
+        :param paper_ids: The arXiv short IDs to look up.
+        :returns:
+         Mapping of paper ID to paper information for the IDs that were found.
+        """
+        found = {}
+        with self._lock:
+            if not self._indexed or any(paper_id not in self._id_topics for paper_id in paper_ids):
+                self._refresh_all()
+            for key in {self._id_topics[paper_id] for paper_id in paper_ids if paper_id in self._id_topics}:
+                self._refresh(key)
+            for paper_id in paper_ids:
+                key = self._id_topics.get(paper_id)
+                if key is not None and paper_id in self._views[key].papers:
+                    found[paper_id] = self._views[key].papers[paper_id]
+        return found
+
+    def iter_papers(self) -> Iterator[Tuple[str, Dict]]:
+        """
+        Iterate over every stored paper exactly once.
+        """
+        with self._lock:
+            self._refresh_all()
+            papers = {}
+            for view in self._views.values():
+                for paper_id, info in view.papers.items():
+                    papers.setdefault(paper_id, info)
+        yield from papers.items()
+
+    def compact_topics(self) -> Dict[str, List[str]]:
+        """
+        Fold directories of the same canonical topic, e.g. "computer" and computers, into one.
+        returns:
+         Mapping of canonical topic to the directories that were folded into it.
+        """
+        with self._lock:
+            groups = duplicate_topic_dirs(self.paper_dir)
+            if not groups:
+                return {}
+            self.flush()
+            with ExitStack() as stack:
+                for item in sorted({item for items in groups.values() for item in items} | set(groups)):
+                    stack.enter_context(self._flock(item, exclusive=True))
+                folded = fold_topic_dirs(self.paper_dir, groups)
+            for key, items in groups.items():
+                for item in items:
+                    journal = self._journals.pop(item, None)
+                    if journal is not None:
+                        journal.close()
+                    self._views.pop(item, None)
+                    self._dirty.discard(item)
+            self._id_topics.clear()
+            self._indexed = False
+            return folded
+
+    def migrate_json_dirs(self) -> int:
+        """
+        The journal store reads the papers_info.json layout natively, nothing to import.
+        """
+        return len(self._topic_keys())
+
+    # ---- durability and compaction --------------------------------------
+
+    def flush(self) -> None:
+        """
+        fsync every journal written since the last flush, one fsync per topic per batch.
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            for key in dirty:
+                os.fsync(self._journals[key].fileno())
+
+    def compact(self, force: bool = False) -> int:
+        """
+        Fold long journals into their checkpoint.
+        args:
+        :param force: Compact every topic with a non-empty journal, regardless of the threshold.
+        :returns:
+         The number of topics compacted.
+        """
+        compacted = 0
+        with self._lock:
+            for key in self._topic_keys():
+                view = self._refresh(key)
+                if view.journal_entries == 0 or (not force and view.journal_entries < self.compact_threshold):
+                    continue
+                with self._flock(key, exclusive=True):
+                    # re-read under the exclusive lock so no concurrent append is lost
+                    view = self._refresh_locked(key)
+                    checkpoint_path = self._path(key, CHECKPOINT_FILE)
+                    tmp_path = checkpoint_path + ".tmp"
+                    with open(tmp_path, "w") as json_file:
+                        json.dump(view.papers, json_file, indent=2)
+                        json_file.flush()
+                        os.fsync(json_file.fileno())
+                    os.replace(tmp_path, checkpoint_path)
+                    os.truncate(self._path(key, JOURNAL_FILE), 0)
+                    self._dirty.discard(key)
+                    view.checkpoint_stamp = self._checkpoint_stamp(key)
+                    view.journal_offset = 0
+                    view.journal_entries = 0
+                compacted += 1
+        return compacted
+
+    def close(self) -> None:
+        self._stop.set()
+        self.flush()
+        with self._lock:
+            for journal in self._journals.values():
+                journal.close()
+            self._journals.clear()
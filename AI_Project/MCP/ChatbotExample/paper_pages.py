@@ -0,0 +1,126 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from paper_catalog import display_name, topic_key
+
+DEFAULT_PAGE_SIZE = 20
+
+
+def render_paper(paper_id: str, paper_info: Dict, duplicates: Optional[List[str]] = None) -> str:
+    """
+    Markdown section for one paper, the summary is cut at 500 characters.
+    """
+    return "".join([
+        f"## {paper_info['title']}\n",
+        f"- **Paper ID**: {paper_id}\n",
+        f"- **Also stored as**: {', '.join(duplicates)}\n" if duplicates else "",
+        f"- **Authors**: {', '.join(paper_info['authors'])}\n",
+        f"- **Published**: {paper_info['published']}\n",
+        f"- **PDF URL**: [{paper_info['pdf_url']}]({paper_info['pdf_url']})\n\n",
+        f"### Summary\n{paper_info['summary'][:500]}...\n\n",
+        "---\n\n",
+    ])
+
+
+class TopicPages:
+    """
+    Renders papers://{topic} one page at a time.
+
+    The sorted ID list of a topic is kept per topic version, so a page only
+    fetches and renders the papers on it. Rendered pages are kept in a small
+    LRU keyed by (topic, cursor, limit) and are dropped as soon as the topic
+    version moves on, i.e. after search_papers stored new papers for it.
+
+    With a DuplicateIndex, render(unique=True) pages through the topic with
+    near-duplicates collapsed into the first paper of each group. Those pages
+    also depend on the duplicate groups, so they are cached per version and
+    generation of the index.
+    """
+
+    def __init__(self, catalog, max_pages: int = 256, dedup=None):
+        self.catalog = catalog
+        self.max_pages = max_pages
+        self.dedup = dedup
+        self._lock = threading.Lock()
+        self._id_lists: Dict[Tuple[str, bool], Tuple[Tuple[int, int], List[Tuple[str, List[str]]]]] = {}
+        self._pages: "OrderedDict[Tuple[str, int, int, bool], Tuple[Tuple[int, int], str]]" = OrderedDict()
+
+    def _stamp(self, version: int, unique: bool) -> Tuple[int, int]:
+        return (version, self.dedup.generation if unique else 0)
+
+    def _paper_ids(self, key: str, stamp: Tuple[int, int], unique: bool) -> List[Tuple[str, List[str]]]:
+        with self._lock:
+            cached = self._id_lists.get((key, unique))
+        if cached and cached[0] == stamp:
+            return cached[1]
+        paper_ids = self.catalog.topic_paper_ids(key)
+        entries = self.dedup.collapse(paper_ids) if unique else [(paper_id, []) for paper_id in paper_ids]
+        with self._lock:
+            self._id_lists[(key, unique)] = (stamp, entries)
+        return entries
+
+    def render(self, topic: str, cursor: int = 0, limit: int = DEFAULT_PAGE_SIZE, unique: bool = False) -> str:
+        """
+        Render one page of a topic as markdown.
+        args:
+        :param topic: The research topic to retrieve papers for.
+        :param cursor: Position in the sorted ID list where the page starts.
+        :param limit: The maximum number of papers on the page.
+        :param unique: Collapse near-duplicates, needs a DuplicateIndex.
+        :returns:
+         The markdown page, ending with the URI of the next page if there is one.
+        """
+        key = topic_key(topic)
+        cursor = max(cursor, 0)
+        limit = max(limit, 1)
+        unique = unique and self.dedup is not None
+        version = self.catalog.topic_version(key)
+        stamp = self._stamp(version, unique)
+
+        page_key = (key, cursor, limit, unique)
+        with self._lock:
+            cached = self._pages.get(page_key)
+            if cached and cached[0] == stamp:
+                self._pages.move_to_end(page_key)
+                return cached[1]
+
+        paper_ids = self._paper_ids(key, stamp, unique)
+        if not paper_ids:
+            return f"# No papers found for topic: {topic}\n\nTry searching for papers on this topic first."
+
+        if cursor >= len(paper_ids):
+            # an explicit answer rather than an empty page saying "Showing papers 101-100"
+            prefix = f"papers://{display_name(topic)}" + ("/unique" if unique else "")
+            kind = "unique papers" if unique else "papers"
+            return (f"# No more papers for topic: {topic}\n\n"
+                    f"The topic has {len(paper_ids)} {kind}, the page starting at {cursor} is past the end.\n\n"
+                    f"First page: {prefix}\n")
+
+        page = paper_ids[cursor:cursor + limit]
+        papers_data = self.catalog.get_papers([paper_id for paper_id, _ in page])
+
+        # Create markdown content with paper details
+        parts = [
+            f"# Papers on {topic.replace('_', ' ').title()}\n\n",
+            f"Total papers: {sum(1 + len(duplicates) for _, duplicates in paper_ids)}\n\n",
+            # clients keep this to ask papers://{topic}/since/{version} whether the topic moved on
+            f"Version: {version}\n\n",
+        ]
+        if unique:
+            parts.append(f"Near-duplicates collapsed: {len(paper_ids)} unique papers\n\n")
+        if cursor or len(paper_ids) > limit:
+            parts.append(f"Showing papers {cursor + 1}-{cursor + len(page)}\n\n")
+        parts.extend(render_paper(paper_id, papers_data[paper_id], duplicates)
+                     for paper_id, duplicates in page if paper_id in papers_data)
+        if cursor + limit < len(paper_ids):
+            prefix = f"papers://{display_name(topic)}" + ("/unique" if unique else "")
+            parts.append(f"Next page: {prefix}/page/{cursor + limit}/{limit}\n")
+        content = "".join(parts)
+
+        with self._lock:
+            self._pages[page_key] = (stamp, content)
+            self._pages.move_to_end(page_key)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        return content
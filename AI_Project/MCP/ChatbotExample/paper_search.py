@@ -0,0 +1,113 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+INDEX_FILE = "search_index.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    doc_id   INTEGER PRIMARY KEY,
+    paper_id TEXT NOT NULL UNIQUE,
+    digest   TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+    title, authors, summary,
+    tokenize = 'porter unicode61 remove_diacritics 2'
+);
+"""
+
+# BM25 column weights: a hit in the title counts more than one in the summary
+TITLE_WEIGHT, AUTHORS_WEIGHT, SUMMARY_WEIGHT = 3.0, 2.0, 1.0
+
+
+def _digest(paper_info: Dict) -> str:
+    text = "\x1f".join([paper_info["title"], ", ".join(paper_info["authors"]), paper_info["summary"]])
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class PaperSearchIndex:
+    """
+    On-disk BM25 full text index over title, authors and summary.
+
+    Backed by an SQLite FTS5 table next to the catalog. A paper is only
+    re-indexed when its text changed, so indexing the results of a search
+    costs a handful of row writes however large the catalog is.
+    """
+
+    def __init__(self, paper_dir: str):
+        os.makedirs(paper_dir, exist_ok=True)
+        self.db_path = os.path.join(paper_dir, INDEX_FILE)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def add_papers(self, papers: Iterable[Tuple[str, Dict]]) -> int:
+        """
+        Index new or changed papers.
+        args:
+        :param papers: (paper ID, paper information) pairs.
+        :returns:
+         The number of papers that were (re)indexed.
+        """
+        indexed = 0
+        with self._lock, self._conn:
+            for paper_id, paper_info in papers:
+                digest = _digest(paper_info)
+                row = self._conn.execute(
+                    "SELECT doc_id, digest FROM docs WHERE paper_id = ?", (paper_id,)
+                ).fetchone()
+                if row and row[1] == digest:
+                    continue
+                if row:
+                    doc_id = row[0]
+                    self._conn.execute("DELETE FROM docs_fts WHERE rowid = ?", (doc_id,))
+                    self._conn.execute("UPDATE docs SET digest = ? WHERE doc_id = ?", (digest, doc_id))
+                else:
+                    doc_id = self._conn.execute(
+                        "INSERT INTO docs(paper_id, digest) VALUES (?, ?)", (paper_id, digest)
+                    ).lastrowid
+                self._conn.execute(
+                    "INSERT INTO docs_fts(rowid, title, authors, summary) VALUES (?, ?, ?, ?)",
+                    (doc_id, paper_info["title"], ", ".join(paper_info["authors"]), paper_info["summary"]),
+                )
+                indexed += 1
+        return indexed
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """
+        Rank stored papers against a free text query with BM25.
+        args:
+        :param query: Free text, every word is optional and better matches rank higher.
+        :param k: The maximum number of results.
+        :returns:
+         (paper ID, score) pairs, best first. Higher scores are better.
+        """
+        words = re.findall(r"\w+", query.lower())
+        if not words:
+            return []
+        # quote every word so FTS5 operators in the query are taken literally
+        match = " OR ".join(f'"{word}"' for word in words)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT d.paper_id, bm25(docs_fts, ?, ?, ?) AS score "
+                "FROM docs_fts JOIN docs d ON d.doc_id = docs_fts.rowid "
+                "WHERE docs_fts MATCH ? ORDER BY score LIMIT ?",
+                (TITLE_WEIGHT, AUTHORS_WEIGHT, SUMMARY_WEIGHT, match, k),
+            ).fetchall()
+        # SQLite's bm25() is negative, flip it so larger means more relevant
+        return [(paper_id, round(-score, 4)) for paper_id, score in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
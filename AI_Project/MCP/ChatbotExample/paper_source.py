@@ -0,0 +1,350 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# the query cache of the server lives in papers/_query_cache, next to the other server-owned dirs
+QUERY_CACHE_DIR = "_query_cache"
+
+
+def normalize_query(topic: str) -> str:
+    """
+    Normalize a topic for use as a cache key: case and whitespace insensitive.
+    """
+    return " ".join(topic.lower().split())
+
+
+class PaperSource(ABC):
+    """
+    Where search_papers gets its results from.
+
+    search returns a mapping of paper ID to paper information in relevance order,
+    using the same fields that are stored in the catalog.
+    """
+
+    @abstractmethod
+    def search(self, topic: str, max_results: int) -> Dict[str, Dict]:
+        ...
+
+    def fetch_newer(self, topic: str, since: Optional[str], max_results: int) -> Dict[str, Dict]:
+        """
+        Papers on a topic published on or after a date, newest first.
+
+        The boundary day is included because dates have no time of day, papers
+        that are already stored come back unchanged and cost nothing to merge.
+
+        The base version filters a relevance search, sources that can sort by
+        submission date override it so only new papers are transferred.
+        args:
+        :param topic: The topic to search for.
+        :param since: ISO date (YYYY-MM-DD) of the newest paper already stored, None for no limit.
+        :param max_results: The maximum number of papers to return.
+        """
+        papers_info = self.search(topic, max_results)
+        newer = sorted(
+            ((paper_id, info) for paper_id, info in papers_info.items() if since is None or info["published"] >= since),
+            key=lambda item: item[1]["published"], reverse=True,
+        )
+        return dict(newer)
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket: rate tokens per second, at most burst tokens saved up.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Block until a token is available and take it.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimitedSource(PaperSource):
+    """
+    Takes a token from a shared bucket before every search of the wrapped source.
+    """
+
+    def __init__(self, source: PaperSource, bucket: TokenBucket):
+        self.source = source
+        self.bucket = bucket
+
+    def search(self, topic: str, max_results: int) -> Dict[str, Dict]:
+        self.bucket.acquire()
+        return self.source.search(topic, max_results)
+
+    def fetch_newer(self, topic: str, since: Optional[str], max_results: int) -> Dict[str, Dict]:
+        self.bucket.acquire()
+        return self.source.fetch_newer(topic, since, max_results)
+
+
+class ArxivSource(PaperSource):
+    """
+    The real arXiv API, one shared client so its connection is reused.
+
+    The client's own per-request delay is turned off, pacing is done by the
+    TokenBucket in RateLimitedSource so concurrent searches share one budget.
+    """
+
+    def __init__(self):
+        import arxiv
+        self._arxiv = arxiv
+        self.client = arxiv.Client(delay_seconds=0)
+
+    def search(self, topic: str, max_results: int) -> Dict[str, Dict]:
+        # Search for the most relevant articles matching the queried topic
+        search = self._arxiv.Search(
+            query=topic,
+            max_results=max_results,
+            sort_by=self._arxiv.SortCriterion.Relevance
+        )
+
+        papers_info = {}
+        for paper in self.client.results(search):
+            papers_info[paper.get_short_id()] = self._paper_info(paper)
+        return papers_info
+
+    def fetch_newer(self, topic: str, since: Optional[str], max_results: int) -> Dict[str, Dict]:
+        # newest submissions first, so the walk stops at the first paper that is already known
+        search = self._arxiv.Search(
+            query=topic,
+            max_results=max_results,
+            sort_by=self._arxiv.SortCriterion.SubmittedDate,
+            sort_order=self._arxiv.SortOrder.Descending,
+        )
+
+        papers_info = {}
+        for paper in self.client.results(search):
+            info = self._paper_info(paper)
+            if since is not None and info["published"] < since:
+                break
+            papers_info[paper.get_short_id()] = info
+        return papers_info
+
+    @staticmethod
+    def _paper_info(paper) -> Dict:
+        return {
+            "title": paper.title,
+            "authors": [author.name for author in paper.authors],
+            "summary": paper.summary,
+            "pdf_url": paper.pdf_url,
+            "published": str(paper.published.date()),
+        }
+
+
+class FixtureSource(PaperSource):
+    """
+    Offline stand-in for arXiv that answers from papers_info.json fixture files.
+
+    fixture_dir uses the papers/<topic>/papers_info.json layout. A paper matches
+    when every word of the topic appears in its title or summary, so results are
+    deterministic for tests and benchmarks.
+    """
+
+    def __init__(self, fixture_dir: str):
+        self.papers: Dict[str, Dict] = {}
+        for item in sorted(os.listdir(fixture_dir)):
+            file_path = os.path.join(fixture_dir, item, "papers_info.json")
+            if os.path.isfile(file_path):
+                with open(file_path, "r") as json_file:
+                    self.papers.update(json.load(json_file))
+
+    def _matches(self, topic: str):
+        words = normalize_query(topic).split()
+        for paper_id, info in self.papers.items():
+            text = f"{info['title']} {info['summary']}".lower()
+            if all(word in text for word in words):
+                yield paper_id, info
+
+    def search(self, topic: str, max_results: int) -> Dict[str, Dict]:
+        papers_info = {}
+        for paper_id, info in self._matches(topic):
+            papers_info[paper_id] = info
+            if len(papers_info) >= max_results:
+                break
+        return papers_info
+
+    def fetch_newer(self, topic: str, since: Optional[str], max_results: int) -> Dict[str, Dict]:
+        newer = [(paper_id, info) for paper_id, info in self._matches(topic)
+                 if since is None or info["published"] >= since]
+        newer.sort(key=lambda item: item[1]["published"], reverse=True)
+        return dict(newer[:max_results])
+
+
+class CachedSource(PaperSource):
+    """
+    Two level cache in front of another source.
+
+    Level one is an in-process LRU, level two is one JSON file per query under
+    cache_dir, so a restarted server does not hit arXiv again for recent queries.
+    Both levels are keyed by the normalized topic and max_results, expire after
+    ttl seconds and are bounded in size, evicting the least recently used entry
+    in memory and the oldest file on disk. The lock only guards the LRU and the
+    counters, cache files are read and written outside it so concurrent lookups
+    of a search_papers_batch do not queue behind each other's file I/O.
+    """
+
+    def __init__(self, source: PaperSource, cache_dir: Optional[str], ttl: float = 3600,
+                 max_entries: int = 256, max_disk_entries: int = 4096):
+        self.source = source
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        # files on disk, counted once here and kept up to date so a miss does not list the directory
+        self._disk_entries = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._disk_entries = len(self._list_disk())
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def _key(topic: str, max_results: int) -> str:
+        return f"{normalize_query(topic)}|{max_results}"
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _list_disk(self):
+        return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith(".json")]
+
+    def _remember(self, key: str, created: float, papers_info: Dict[str, Dict]) -> None:
+        self._memory[key] = (created, papers_info)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _read_disk(self, key: str) -> Optional[tuple]:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "r") as json_file:
+                entry = json.load(json_file)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return None
+        if entry.get("key") != key:
+            return None
+        return entry["created"], entry["results"]
+
+    def _write_disk(self, key: str, created: float, papers_info: Dict[str, Dict]) -> None:
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        is_new = not os.path.exists(path)
+        # one tmp file per writer, os.replace makes whichever finishes last the visible one
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as json_file:
+            json.dump({"key": key, "created": created, "results": papers_info}, json_file)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if is_new:
+                self._disk_entries += 1
+            if self._disk_entries <= self.max_disk_entries:
+                return
+
+        # over the cap: only now list the files, which also corrects the count for other processes' writes
+        entries = self._list_disk()
+        entries.sort(key=os.path.getmtime)
+        evicted = 0
+        for old_path in entries[:max(0, len(entries) - self.max_disk_entries)]:
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                continue
+            evicted += 1
+        with self._lock:
+            self.stats["evictions"] += evicted
+            self._disk_entries = min(len(entries), self.max_disk_entries)
+
+    def search(self, topic: str, max_results: int) -> Dict[str, Dict]:
+        key = self._key(topic, max_results)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return dict(entry[1])
+
+        entry = self._read_disk(key)
+        if entry and now - entry[0] < self.ttl:
+            with self._lock:
+                self._remember(key, entry[0], entry[1])
+                self.stats["disk_hits"] += 1
+            return dict(entry[1])
+
+        with self._lock:
+            self.stats["misses"] += 1
+        # the network call happens outside the lock so other topics are not blocked
+        papers_info = self.source.search(topic, max_results)
+        with self._lock:
+            self._remember(key, now, papers_info)
+        self._write_disk(key, now, papers_info)
+        return dict(papers_info)
+
+    def fetch_newer(self, topic: str, since: Optional[str], max_results: int) -> Dict[str, Dict]:
+        # a refresh wants what is new right now, never a cached answer
+        return self.source.fetch_newer(topic, since, max_results)
+
+    def get_stats(self) -> Dict:
+        """
+        Hit and miss counters plus the current cache sizes.
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        total = hits + stats["misses"]
+        stats["hit_rate"] = round(hits / total, 4) if total else 0.0
+        return stats
+
+
+def source_from_env(cache_dir: Optional[str]) -> CachedSource:
+    """
+    Build the paper source used by the server.
+
+    PAPER_SOURCE=fixture:<dir> answers from local fixture files instead of arXiv.
+    ARXIV_CACHE_TTL, ARXIV_CACHE_SIZE and ARXIV_CACHE_DISK_SIZE tune the cache,
+    ARXIV_RATE (requests per second) and ARXIV_BURST the arXiv rate limit.
+    """
+    source_spec = os.environ.get("PAPER_SOURCE", "arxiv")
+    if source_spec.startswith("fixture:"):
+        source = FixtureSource(source_spec[len("fixture:"):])
+    else:
+        # arXiv asks for no more than one request every three seconds on average
+        bucket = TokenBucket(
+            rate=float(os.environ.get("ARXIV_RATE", 1 / 3)),
+            burst=int(os.environ.get("ARXIV_BURST", 3)),
+        )
+        source = RateLimitedSource(ArxivSource(), bucket)
+    return CachedSource(
+        source,
+        cache_dir,
+        ttl=float(os.environ.get("ARXIV_CACHE_TTL", 3600)),
+        max_entries=int(os.environ.get("ARXIV_CACHE_SIZE", 256)),
+        max_disk_entries=int(os.environ.get("ARXIV_CACHE_DISK_SIZE", 4096)),
+    )
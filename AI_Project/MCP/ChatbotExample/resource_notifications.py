@@ -0,0 +1,82 @@
+import threading
+import weakref
+from typing import Dict, Iterable, List
+
+from pydantic import AnyUrl
+
+
+class ResourceSubscriptions:
+    """
+    Sessions subscribed to resource URIs and the notifications sent to them.
+
+    Sessions are held weakly, a client that disconnects without unsubscribing
+    drops out on its own. A session whose stream is already closed is removed
+    the first time a notification to it fails.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, "weakref.WeakSet"] = {}
+        # every session that subscribed to anything, they also get the list_changed notifications
+        self._sessions: "weakref.WeakSet" = weakref.WeakSet()
+
+    def subscribe(self, uri: str, session) -> None:
+        with self._lock:
+            self._subscribers.setdefault(uri, weakref.WeakSet()).add(session)
+            self._sessions.add(session)
+
+    def unsubscribe(self, uri: str, session) -> None:
+        with self._lock:
+            sessions = self._subscribers.get(uri)
+            if sessions is not None:
+                sessions.discard(session)
+                if not sessions:
+                    del self._subscribers[uri]
+
+    def uris(self) -> List[str]:
+        """
+        The URIs at least one session is subscribed to.
+        """
+        with self._lock:
+            return [uri for uri, sessions in self._subscribers.items() if sessions]
+
+    def _drop(self, session) -> None:
+        with self._lock:
+            self._sessions.discard(session)
+            for uri in list(self._subscribers):
+                self._subscribers[uri].discard(session)
+                if not self._subscribers[uri]:
+                    del self._subscribers[uri]
+
+    async def notify_updated(self, uris: Iterable[str]) -> int:
+        """
+        Send notifications/resources/updated for every URI to its subscribers.
+        :returns: The number of notifications sent.
+        """
+        sent = 0
+        for uri in dict.fromkeys(uris):
+            with self._lock:
+                sessions = list(self._subscribers.get(uri, ()))
+            for session in sessions:
+                try:
+                    await session.send_resource_updated(AnyUrl(uri))
+                    sent += 1
+                except Exception:
+                    self._drop(session)
+        return sent
+
+    async def notify_list_changed(self) -> int:
+        """
+        Send notifications/resources/list_changed to every subscribed session.
+        :returns: The number of notifications sent.
+        """
+        with self._lock:
+            sessions = list(self._sessions)
+        sent = 0
+        for session in sessions:
+            try:
+                await session.send_resource_list_changed()
+                sent += 1
+            except Exception:
+                self._drop(session)
+        return sent
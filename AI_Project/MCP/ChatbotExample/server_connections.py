@@ -0,0 +1,514 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+import anyio
+from mcp import ClientSession, McpError, types
+from pydantic import AnyUrl
+
+from capability_cache import CapabilityCache
+from server_transport import open_transport
+
+DEFAULT_STARTUP_TIMEOUT = float(os.environ.get("SERVER_STARTUP_TIMEOUT", 10))
+# seconds a connected server may sit unused before it is shut down, 0 keeps servers running
+DEFAULT_IDLE_TIMEOUT = float(os.environ.get("SERVER_IDLE_TIMEOUT", 600))
+# seconds between pings of a connected server that has no calls in flight, 0 turns the health check off
+DEFAULT_HEALTH_INTERVAL = float(os.environ.get("SERVER_HEALTH_INTERVAL", 30))
+# a failed server is started again after 0s, then 1, 2, 4... seconds, at most this long
+MAX_RESTART_BACKOFF = float(os.environ.get("SERVER_MAX_RESTART_BACKOFF", 30))
+# consecutive failed restarts after which the pool stops restarting a crashed server by itself
+MAX_RESTART_ATTEMPTS = 5
+
+# raised when a request is written to a connection whose server is gone, the server never saw it
+_CLOSED_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError)
+
+
+class ServerConnection:
+    """
+    One server of server_config.json, connected by a task that owns its transport and session.
+
+    The transport and ClientSession are entered and exited by the same task,
+    anyio requires that, which is why servers are not kept on a shared
+    AsyncExitStack once they start concurrently. After initialize, the
+    tools, prompts and resources are listed concurrently, and only for the
+    capabilities the server announced.
+
+    The connection can stand in for its ClientSession: call_tool, get_prompt,
+    read_resource and friends start the server if it is not running and wait
+    until it is connected. That lets a chatbot register a server from the
+    capability cache before it is up, and lets the pool stop an idle server
+    and have the next call start it again.
+
+    A server that dies is noticed by the next request, which fails on the
+    closed connection, or by the ping sent every healthInterval seconds
+    while no call is in flight. Either disconnects it as failed. A request
+    that was never written is sent again on a fresh start, one that was in
+    flight when the server died raises, it may have had effects. Failed
+    starts back off exponentially: until retry_at, requests fail at once
+    instead of spawning the server again.
+
+    With "replicas": N in its config, N - 1 more copies of the server are
+    kept in replicas. They start on demand, call_tool sends each call of a
+    tool annotated readOnlyHint to the copy with the fewest calls in flight,
+    so CPU heavy tools of a stdio server run in parallel. Every copy has its
+    own process state, so all other tools, prompts, resources and
+    subscriptions go to this first copy: what a tool like search_papers
+    stores in memory is only ever seen by the copy that stored it. Only set
+    replicas for servers whose read-only tools read state every copy sees,
+    like files on disk.
+    """
+
+    def __init__(self, name: str, server_config: Dict[str, Any],
+                 message_handler: Optional[Callable[["ServerConnection", Any], Awaitable[None]]] = None,
+                 on_ready: Optional[Callable[["ServerConnection"], None]] = None,
+                 on_done: Optional[Callable[["ServerConnection"], None]] = None):
+        self.name = name
+        config = dict(server_config)
+        # optional per server settings, not part of the transport parameters
+        self.startup_timeout = float(config.pop("startupTimeout", DEFAULT_STARTUP_TIMEOUT))
+        self.idle_timeout = float(config.pop("idleTimeout", DEFAULT_IDLE_TIMEOUT))
+        self.health_interval = float(config.pop("healthInterval", DEFAULT_HEALTH_INTERVAL))
+        self.lazy = bool(config.pop("lazy", True))
+        replica_count = max(1, int(config.pop("replicas", 1)))
+        # tools whose results the chatbot may memoize, on top of those annotated idempotentHint
+        self.cache_tools: List[str] = list(config.pop("cacheTools", []))
+        self.config = config
+        self.message_handler = message_handler
+        self.on_ready = on_ready
+        self.on_done = on_done
+
+        self.session: Optional[ClientSession] = None
+        self.initialize_result: Optional[types.InitializeResult] = None
+        self.tools: List[types.Tool] = []
+        self.prompts: List[types.Prompt] = []
+        self.resources: List[types.Resource] = []
+        self.error: Optional[BaseException] = None
+        self.timings: Dict[str, float] = {}
+        # the listings came from the capability cache and have not been checked against the server yet
+        self.from_cache = False
+        self.starts = 0
+        self.in_flight = 0
+        self.last_used = time.monotonic()
+        # consecutive failed starts and crashes, and when the next start is allowed
+        self.failures = 0
+        self.retry_at = 0.0
+        # the server died after it was connected and has not been connected again since
+        self.crashed = False
+
+        self.ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+        replica_config = {key: value for key, value in server_config.items() if key != "replicas"}
+        self.replicas: List[ServerConnection] = [self] + [
+            ServerConnection(name, replica_config, message_handler) for _ in range(replica_count - 1)]
+
+    @property
+    def status(self) -> str:
+        if self.session is not None:
+            return "ready"
+        if self.task is not None and not self.task.done():
+            return "starting"
+        return "failed" if self.error is not None else "stopped"
+
+    @property
+    def backing_off(self) -> bool:
+        return self.error is not None and time.monotonic() < self.retry_at
+
+    @property
+    def idempotent_tools(self) -> Set[str]:
+        annotated = {tool.name for tool in self.tools if tool.annotations and tool.annotations.idempotentHint}
+        return annotated | set(self.cache_tools)
+
+    @property
+    def read_only_tools(self) -> Set[str]:
+        return {tool.name for tool in self.tools if tool.annotations and tool.annotations.readOnlyHint}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        The initialize result and listings as plain Json, the capability cache entry of this server.
+        """
+        return {
+            "initialize": self.initialize_result.model_dump(mode="json", by_alias=True, exclude_none=True),
+            "tools": [tool.model_dump(mode="json", by_alias=True, exclude_none=True) for tool in self.tools],
+            "prompts": [prompt.model_dump(mode="json", by_alias=True, exclude_none=True) for prompt in self.prompts],
+            "resources": [resource.model_dump(mode="json", by_alias=True, exclude_none=True)
+                          for resource in self.resources],
+        }
+
+    def load(self, entry: Dict[str, Any]) -> None:
+        """
+        Take the initialize result and listings from a capability cache entry.
+        """
+        self.initialize_result = types.InitializeResult.model_validate(entry["initialize"])
+        self.tools = [types.Tool.model_validate(tool) for tool in entry["tools"]]
+        self.prompts = [types.Prompt.model_validate(prompt) for prompt in entry["prompts"]]
+        self.resources = [types.Resource.model_validate(resource) for resource in entry["resources"]]
+        self.from_cache = True
+
+    def ensure_started(self) -> None:
+        """
+        Start the server unless it is running or starting already.
+        """
+        if self.task is not None and not self.task.done():
+            return
+        self.ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self.error = None
+        self.starts += 1
+        self.task = asyncio.create_task(self.run())
+        if self.on_done is not None:
+            self.task.add_done_callback(lambda _: self.on_done(self))
+
+    async def live_session(self) -> ClientSession:
+        """
+        The connected session, starts the server if needed and waits while it is starting.
+        """
+        if self.task is not None and self._stop.is_set():
+            # an idle shutdown or a broken connection is being closed, let it finish and start again
+            await asyncio.gather(self.task, return_exceptions=True)
+        if self.status == "failed" and self.backing_off:
+            raise RuntimeError(f"Server {self.name} failed, next start in "
+                               f"{self.retry_at - time.monotonic():.0f}s: {self.error}")
+        self.ensure_started()
+        await self.ready.wait()
+        if self.session is None:
+            raise RuntimeError(f"Server {self.name} is not connected: {self.error}")
+        return self.session
+
+    def mark_broken(self, session: ClientSession, error: BaseException) -> None:
+        """
+        Disconnect a session whose server died, the run ends as failed.
+        """
+        if self.session is session and not self._stop.is_set():
+            self.error = error
+            self._stop.set()
+
+    async def _request(self, send: Callable[[ClientSession], Awaitable[Any]]) -> Any:
+        # counts the call so the pool never shuts the server down under it
+        self.in_flight += 1
+        try:
+            for attempt in range(2):
+                session = await self.live_session()
+                try:
+                    result = await send(session)
+                except _CLOSED_ERRORS as e:
+                    # the server is gone and never got the request, send it once more to a fresh start
+                    self.mark_broken(session, e)
+                    if attempt:
+                        raise
+                    continue
+                except McpError as e:
+                    if e.error.code == types.CONNECTION_CLOSED:
+                        self.mark_broken(session, e)
+                    raise
+                self.failures = 0
+                return result
+        finally:
+            self.in_flight -= 1
+            self.last_used = time.monotonic()
+
+    def pick_replica(self) -> "ServerConnection":
+        """
+        The copy with the fewest calls in flight, connected copies first, skipping those backing off.
+        """
+        candidates = [replica for replica in self.replicas if not replica.backing_off] or self.replicas
+        return min(candidates, key=lambda replica: (replica.in_flight, replica.status != "ready"))
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None) -> types.CallToolResult:
+        # tools that change state stay on this copy, the replicas would not see what they stored
+        target = self.pick_replica() if name in self.read_only_tools else self
+        return await target._request(lambda session: session.call_tool(name, arguments=arguments))
+
+    async def get_prompt(self, name: str, arguments: Optional[Dict[str, str]] = None) -> types.GetPromptResult:
+        return await self._request(lambda session: session.get_prompt(name, arguments=arguments))
+
+    async def read_resource(self, uri: AnyUrl) -> types.ReadResourceResult:
+        return await self._request(lambda session: session.read_resource(uri))
+
+    async def subscribe_resource(self, uri: AnyUrl) -> types.EmptyResult:
+        return await self._request(lambda session: session.subscribe_resource(uri))
+
+    async def list_resources(self) -> types.ListResourcesResult:
+        return await self._request(lambda session: session.list_resources())
+
+    async def _handle_message(self, message) -> None:
+        await self.message_handler(self, message)
+
+    async def _list(self, session: ClientSession) -> None:
+        capabilities = self.initialize_result.capabilities
+        calls = []
+        if capabilities.tools:
+            calls.append(session.list_tools())
+        if capabilities.prompts:
+            calls.append(session.list_prompts())
+        if capabilities.resources:
+            calls.append(session.list_resources())
+        for result in await asyncio.gather(*calls):
+            if isinstance(result, types.ListToolsResult):
+                self.tools = result.tools
+            elif isinstance(result, types.ListPromptsResult):
+                self.prompts = result.prompts
+            elif isinstance(result, types.ListResourcesResult):
+                self.resources = result.resources
+
+    async def _watch(self, session: ClientSession) -> None:
+        # stay connected until stop(); ping while idle, a busy server may not answer pings in time
+        while True:
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.health_interval or None)
+                return
+            except asyncio.TimeoutError:
+                pass
+            if self.in_flight == 0:
+                await asyncio.wait_for(session.send_ping(), self.health_interval)
+                self.failures = 0
+
+    async def run(self) -> None:
+        """
+        Connect, list, hand the connection to on_ready and stay connected until stop() or the server dies.
+        """
+        start = time.perf_counter()
+        try:
+            async with open_transport(self.config) as (read, write):
+                async with ClientSession(
+                    read, write,
+                    message_handler=self._handle_message if self.message_handler else None,
+                ) as session:
+                    self.initialize_result = await session.initialize()
+                    self.timings["initialize"] = time.perf_counter() - start
+                    await self._list(session)
+                    self.timings["list"] = time.perf_counter() - start - self.timings["initialize"]
+                    self.timings["ready"] = time.perf_counter() - start
+                    self.session = session
+                    self.last_used = time.monotonic()
+                    if self.on_ready is not None:
+                        self.on_ready(self)
+                    self.from_cache = False
+                    self.crashed = False
+                    self.ready.set()
+                    await self._watch(session)
+        except Exception as e:
+            # the transport and session task groups wrap what actually went wrong
+            while isinstance(e, ExceptionGroup) and len(e.exceptions) == 1:
+                e = e.exceptions[0]
+            self.error = e
+        finally:
+            if self.error is not None:
+                # a restart that fails after a crash still counts as recovering from that crash
+                self.crashed = self.crashed or self.session is not None
+                self.failures += 1
+                backoff = 0 if self.failures == 1 else min(MAX_RESTART_BACKOFF, 2 ** (self.failures - 2))
+                self.retry_at = time.monotonic() + backoff
+            self.session = None
+            # wake up whoever waits for this server, it is not coming
+            self.ready.set()
+
+    async def stop(self) -> None:
+        """
+        Disconnect and shut the server down, the next call starts it again.
+        """
+        if self.task is None:
+            return
+        self._stop.set()
+        if self.session is None:
+            self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+
+    async def stop_all(self) -> None:
+        """
+        Shut this server and all its replicas down.
+        """
+        await asyncio.gather(*(replica.stop() for replica in self.replicas))
+
+
+class ServerPool:
+    """
+    Starts every configured server at once instead of one after another.
+
+    Startup waits for each server until its deadline (startupTimeout in its
+    config, SERVER_STARTUP_TIMEOUT seconds by default) and then prints a
+    report with the timings of every server. A server that misses its
+    deadline, e.g. an `npx -y` still downloading its package, keeps starting
+    in the background and is registered through on_ready when it comes up.
+
+    With a CapabilityCache, a server listed in the cache is registered from
+    it right away and startup does not wait for it at all. Such a server is
+    not even spawned until the first call is routed to it, unless its config
+    says "lazy": false. Its live listing revalidates the entry once it runs.
+    If the server now reports another version or other tools, prompts or
+    resources, the cache entry is replaced and on_ready runs again, so
+    on_ready must replace an earlier registration of the same connection
+    rather than add to it.
+
+    A server that had no calls for idleTimeout seconds (SERVER_IDLE_TIMEOUT,
+    default 600, 0 keeps it running) is shut down and on_stopped is called,
+    e.g. to forget resource subscriptions. Its next call restarts it.
+
+    The pool also supervises the servers: one that dies after it was
+    connected is started again after its backoff, up to MAX_RESTART_ATTEMPTS
+    times in a row, and registered again through on_ready once it is back.
+    Replicas are not supervised, the next call routed to one restarts it.
+    """
+
+    def __init__(self, on_ready: Callable[[ServerConnection], None],
+                 message_handler: Optional[Callable[[ServerConnection, Any], Awaitable[None]]] = None,
+                 cache: Optional[CapabilityCache] = None,
+                 on_stopped: Optional[Callable[[ServerConnection], None]] = None):
+        self.on_ready = on_ready
+        self.message_handler = message_handler
+        self.cache = cache
+        self.on_stopped = on_stopped
+        self.connections: Dict[str, ServerConnection] = {}
+        self._registered = set()
+        self._started = False
+        self._closing = False
+        self._reaper: Optional[asyncio.Task] = None
+        self._restarts: Dict[str, asyncio.TimerHandle] = {}
+
+    def _register(self, connection: ServerConnection) -> None:
+        try:
+            self.on_ready(connection)
+        except Exception as e:
+            print(f"Error registering server {connection.name}: {e}")
+        self._registered.add(connection.name)
+
+    def _ready(self, connection: ServerConnection) -> None:
+        registered = connection.name in self._registered
+        if self.cache is not None:
+            changed = self.cache.put(connection.config, connection.snapshot())
+        else:
+            changed = not registered
+        if registered:
+            if connection.crashed:
+                self._register(connection)
+                print(f"\nServer {connection.name} restarted after a crash, registration renewed")
+            elif changed:
+                # the revalidation of a cached server
+                self._register(connection)
+                print(f"\nServer {connection.name} changed since it was cached, registration updated")
+            return
+        self._register(connection)
+        if self._started:
+            print(f"\nServer {connection.name} attached in the background after "
+                  f"{connection.timings['ready']:.2f}s")
+
+    def _done(self, connection: ServerConnection) -> None:
+        if self._started and connection.error is not None:
+            print(f"\nServer {connection.name} failed: {type(connection.error).__name__}: {connection.error}")
+        if self.on_stopped is not None and connection.name in self._registered:
+            self.on_stopped(connection)
+        if connection.crashed and not self._closing:
+            if connection.failures > MAX_RESTART_ATTEMPTS:
+                print(f"\nServer {connection.name} keeps failing, it is started again on its next call")
+                return
+            delay = max(0.0, connection.retry_at - time.monotonic())
+            print(f"\nRestarting server {connection.name} in {delay:.0f}s")
+            self._restarts[connection.name] = asyncio.get_running_loop().call_later(
+                delay, self._restart, connection)
+
+    def _restart(self, connection: ServerConnection) -> None:
+        self._restarts.pop(connection.name, None)
+        # a call may have started it already
+        if not self._closing and connection.status == "failed":
+            connection.ensure_started()
+
+    async def start(self, server_configs: Dict[str, Dict[str, Any]]) -> List[ServerConnection]:
+        """
+        Start all servers and wait for each one until its deadline.
+        args:
+        :param server_configs: The "mcpServers" mapping of server_config.json.
+        :returns:
+         The connections, in config order, ready, failed, starting or, when lazy, stopped.
+        """
+        connections = [ServerConnection(name, config, self.message_handler, self._ready, self._done)
+                       for name, config in server_configs.items()]
+        for connection in connections:
+            self.connections[connection.name] = connection
+            entry = self.cache.get(connection.config) if self.cache is not None else None
+            if entry is not None:
+                connection.load(entry)
+                self._register(connection)
+        for connection in connections:
+            if not (connection.lazy and connection.from_cache):
+                connection.ensure_started()
+
+        async def wait(connection: ServerConnection) -> None:
+            try:
+                await asyncio.wait_for(connection.ready.wait(), connection.startup_timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        start = time.perf_counter()
+        await asyncio.gather(*(wait(connection) for connection in connections if not connection.from_cache))
+        self._started = True
+        print(self.startup_report(connections, time.perf_counter() - start))
+        if any(connection.idle_timeout > 0 for connection in connections):
+            self._reaper = asyncio.create_task(self._stop_idle_servers())
+        return connections
+
+    async def _stop_idle_servers(self) -> None:
+        timeouts = [connection.idle_timeout for connection in self.connections.values() if connection.idle_timeout > 0]
+        poll = max(1.0, min(timeouts) / 4)
+        while True:
+            await asyncio.sleep(poll)
+            now = time.monotonic()
+            idle = [replica for connection in self.connections.values() for replica in connection.replicas
+                    if replica.idle_timeout > 0 and replica.status == "ready"
+                    and replica.in_flight == 0 and now - replica.last_used >= replica.idle_timeout]
+            await asyncio.gather(*(connection.stop() for connection in idle))
+
+    @staticmethod
+    def startup_report(connections: List[ServerConnection], elapsed: float) -> str:
+        lines = [f"Server startup took {elapsed:.2f}s:"]
+        for connection in connections:
+            status = connection.status
+            if status == "ready":
+                timings = connection.timings
+                detail = (f"initialize {timings['initialize']:.2f}s, list {timings['list']:.2f}s, "
+                          f"{len(connection.tools)} tools, {len(connection.prompts)} prompts, "
+                          f"{len(connection.resources)} resources")
+            elif status == "failed":
+                detail = f"{type(connection.error).__name__}: {connection.error}"
+            elif connection.from_cache:
+                detail = (f"{len(connection.tools)} tools, {len(connection.prompts)} prompts, "
+                          f"{len(connection.resources)} resources from the cache, ")
+                detail += "revalidating in the background" if status == "starting" else "starts on first use"
+                status = "cached"
+            else:
+                detail = f"not up after {connection.startup_timeout:.0f}s, attaching in the background"
+            if len(connection.replicas) > 1:
+                detail += f", {len(connection.replicas) - 1} more replicas on demand"
+            lines.append(f"  {connection.name:<12} {status:<8} {detail}")
+        return "\n".join(lines)
+
+    def status_report(self) -> str:
+        """
+        One line per server replica: status, calls in flight, starts and the last error.
+        """
+        lines = []
+        for connection in self.connections.values():
+            for index, replica in enumerate(connection.replicas):
+                name = connection.name if index == 0 else f"{connection.name}#{index}"
+                line = (f"  {name:<14} {replica.status:<8} in flight {replica.in_flight}, "
+                        f"starts {replica.starts}, failures {replica.failures}")
+                if replica.error is not None:
+                    line += f", last error {type(replica.error).__name__}: {replica.error}"
+                lines.append(line)
+        return "\n".join(lines)
+
+    async def close(self) -> None:
+        """
+        Disconnect every server, each from the task that connected it.
+        """
+        self._closing = True
+        for handle in self._restarts.values():
+            handle.cancel()
+        self._restarts.clear()
+        if self._reaper is not None:
+            self._reaper.cancel()
+            await asyncio.gather(self._reaper, return_exceptions=True)
+            self._reaper = None
+        await asyncio.gather(*(connection.stop_all() for connection in self.connections.values()))
+        self.connections.clear()
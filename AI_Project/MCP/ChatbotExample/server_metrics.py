@@ -0,0 +1,205 @@
+import bisect
+import functools
+import inspect
+import json
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+def _response_bytes(result: Any) -> int:
+    if isinstance(result, str):
+        return len(result.encode("utf-8"))
+    if isinstance(result, bytes):
+        return len(result)
+    return len(json.dumps(result, default=str).encode("utf-8"))
+
+
+def peak_rss_kb() -> Optional[int]:
+    """
+    Peak resident set size of this process in KiB, None where the platform does not report it.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KiB
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Nearest-rank q-quantile of raw samples, 0.0 for none. The load test and benchmark scripts report with it.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _HandlerStats:
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.calls = 0
+        self.errors = 0
+        self.latency_ms_sum = 0.0
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.response_bytes_sum = 0
+        self.response_bytes_max = 0
+
+
+class ServerMetrics:
+    """
+    Call counts, error counts, latency histograms and response sizes per MCP handler.
+
+    Recording a call is a perf_counter pair, a bisect and a few additions under
+    a lock, cheap enough to leave on all the time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handlers: Dict[str, _HandlerStats] = {}
+        self.started = time.time()
+
+    def record(self, kind: str, name: str, elapsed_ms: float, response_bytes: int, error: bool) -> None:
+        bucket = bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)
+        with self._lock:
+            stats = self._handlers.get(name)
+            if stats is None:
+                stats = self._handlers[name] = _HandlerStats(kind)
+            stats.calls += 1
+            stats.errors += error
+            stats.latency_ms_sum += elapsed_ms
+            stats.bucket_counts[bucket] += 1
+            stats.response_bytes_sum += response_bytes
+            stats.response_bytes_max = max(stats.response_bytes_max, response_bytes)
+
+    def instrument(self, kind: str) -> Callable:
+        """
+        Decorator that records every call of a tool or resource handler.
+
+        Put it below @mcp.tool() / @mcp.resource(), the wrapper keeps the
+        signature and docstring FastMCP builds the schema from.
+        args:
+        :param kind: "tool" or "resource", reported next to the handler name.
+        """
+
+        def decorator(fn: Callable) -> Callable:
+            name = fn.__name__
+
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        result = await fn(*args, **kwargs)
+                    except Exception:
+                        self.record(kind, name, (time.perf_counter() - start) * 1000, 0, True)
+                        raise
+                    self.record(kind, name, (time.perf_counter() - start) * 1000, _response_bytes(result), False)
+                    return result
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception:
+                    self.record(kind, name, (time.perf_counter() - start) * 1000, 0, True)
+                    raise
+                self.record(kind, name, (time.perf_counter() - start) * 1000, _response_bytes(result), False)
+                return result
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    def _quantile(stats: _HandlerStats, q: float) -> float:
+        """
+        Upper bound of the histogram bucket holding the q-quantile, like Prometheus' histogram_quantile.
+        """
+        rank = q * stats.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS + [float("inf")], stats.bucket_counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> Dict:
+        """
+        All counters as a json friendly dict.
+        """
+        handlers = {}
+        with self._lock:
+            for name, stats in sorted(self._handlers.items()):
+                handlers[name] = {
+                    "kind": stats.kind,
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "latency_ms_avg": round(stats.latency_ms_sum / stats.calls, 3) if stats.calls else 0,
+                    "latency_ms_p50": self._quantile(stats, 0.5),
+                    "latency_ms_p99": self._quantile(stats, 0.99),
+                    "latency_ms_buckets": {
+                        f"le_{bound}": count
+                        for bound, count in zip(LATENCY_BUCKETS_MS + ["inf"], stats.bucket_counts)
+                    },
+                    "response_bytes_avg": stats.response_bytes_sum // stats.calls if stats.calls else 0,
+                    "response_bytes_max": stats.response_bytes_max,
+                }
+        return {
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "peak_rss_kb": peak_rss_kb(),
+            "handlers": handlers,
+        }
+
+    def prometheus_text(self) -> str:
+        """
+        The same counters in the Prometheus text exposition format.
+
+        Every metric family is written as one block, its HELP and TYPE lines
+        followed by the samples of all handlers, as the format requires.
+        """
+        with self._lock:
+            handlers = [(f'handler="{name}",kind="{stats.kind}"', stats) for name, stats in sorted(self._handlers.items())]
+
+            lines: List[str] = [
+                "# HELP mcp_handler_calls_total Calls of each tool and resource handler.",
+                "# TYPE mcp_handler_calls_total counter",
+            ]
+            lines.extend(f"mcp_handler_calls_total{{{labels}}} {stats.calls}" for labels, stats in handlers)
+
+            lines.extend([
+                "# HELP mcp_handler_errors_total Calls that raised.",
+                "# TYPE mcp_handler_errors_total counter",
+            ])
+            lines.extend(f"mcp_handler_errors_total{{{labels}}} {stats.errors}" for labels, stats in handlers)
+
+            lines.extend([
+                "# HELP mcp_handler_latency_ms Handler latency in milliseconds.",
+                "# TYPE mcp_handler_latency_ms histogram",
+            ])
+            for labels, stats in handlers:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS_MS + ["+Inf"], stats.bucket_counts):
+                    cumulative += count
+                    lines.append(f'mcp_handler_latency_ms_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"mcp_handler_latency_ms_sum{{{labels}}} {round(stats.latency_ms_sum, 3)}")
+                lines.append(f"mcp_handler_latency_ms_count{{{labels}}} {stats.calls}")
+
+            lines.extend([
+                "# HELP mcp_handler_response_bytes_total Bytes returned by each handler.",
+                "# TYPE mcp_handler_response_bytes_total counter",
+            ])
+            lines.extend(f"mcp_handler_response_bytes_total{{{labels}}} {stats.response_bytes_sum}"
+                         for labels, stats in handlers)
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,31 @@
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+from mcp import StdioServerParameters, stdio_client
+from mcp.client.sse import sse_client
+from mcp.client.streamable_http import streamablehttp_client
+
+
+@asynccontextmanager
+async def open_transport(server_config: Dict[str, Any]):
+    """
+    Open the transport described by one entry of server_config.json.
+
+    {"command": ..., "args": [...]} spawns a private stdio server for this client,
+    {"url": "http://host:port/mcp/"} connects to a shared streamable HTTP server and
+    {"url": "http://host:port/sse"} to a shared server started with --transport sse.
+    args:
+    :param server_config: One value of the "mcpServers" mapping.
+    :returns:
+     An async context manager yielding the (read, write) streams for a ClientSession.
+    """
+    url = server_config.get("url")
+    if url is None:
+        async with stdio_client(StdioServerParameters(**server_config)) as (read, write):
+            yield read, write
+    elif url.rstrip("/").endswith("/sse"):
+        async with sse_client(url, headers=server_config.get("headers")) as (read, write):
+            yield read, write
+    else:
+        async with streamablehttp_client(url, headers=server_config.get("headers")) as (read, write, _):
+            yield read, write
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from mcp import types
+
+TOOL_CACHE_DIR = os.environ.get("TOOL_CACHE_DIR", ".tool_cache")
+
+
+def tool_cache_key(server: str, tool_name: str, arguments: Optional[Dict[str, Any]]) -> str:
+    """
+    Cache key of one call: the server, the tool and its arguments as canonical Json.
+    Key order and whitespace of the arguments do not matter.
+    """
+    canonical = json.dumps(arguments or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return f"{server}|{tool_name}|{canonical}"
+
+
+class ToolResultCache:
+    """
+    Client side memo of the results of idempotent tools.
+
+    The model often repeats an extract_info or fetch call within and across
+    conversations, a hit answers it without an MCP round trip. Only tools a
+    server declares idempotent are cached: tools with the idempotentHint
+    annotation, or listed under "cacheTools" in their server_config.json
+    entry. Error results are never cached, so idempotent tools report unknown
+    papers and failed downloads as errors rather than as normal answers.
+
+    Level one is an in-process LRU, level two is one JSON file per call under
+    cache_dir (None keeps the cache in memory only), like the arXiv query
+    cache of the server. Both levels expire after ttl seconds and are bounded
+    in size, evicting the least recently used entry in memory and the oldest
+    file on disk.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = TOOL_CACHE_DIR, ttl: float = 3600,
+                 max_entries: int = 512, max_disk_entries: int = 4096):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        # files on disk, counted once here and kept up to date so a put does not list the directory
+        self._disk_entries = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._disk_entries = len(self._list_disk())
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "evictions": 0}
+
+    @staticmethod
+    def cacheable(session, tool_name: str) -> bool:
+        # plain ClientSessions have no listings to read the annotations from, they are never cached
+        return tool_name in getattr(session, "idempotent_tools", ())
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _list_disk(self):
+        return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith(".json")]
+
+    def _remember(self, key: str, created: float, result: Dict[str, Any]) -> None:
+        self._memory[key] = (created, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _read_disk(self, key: str) -> Optional[tuple]:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "r") as json_file:
+                entry = json.load(json_file)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return None
+        if entry.get("key") != key:
+            return None
+        return entry["created"], entry["result"]
+
+    def _write_disk(self, key: str, created: float, result: Dict[str, Any]) -> None:
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        is_new = not os.path.exists(path)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as json_file:
+            json.dump({"key": key, "created": created, "result": result}, json_file)
+        os.replace(tmp_path, path)
+        if is_new:
+            self._disk_entries += 1
+        if self._disk_entries <= self.max_disk_entries:
+            return
+
+        # over the cap: only now list the files, which also corrects the count for other processes' writes
+        entries = self._list_disk()
+        entries.sort(key=os.path.getmtime)
+        for old_path in entries[:max(0, len(entries) - self.max_disk_entries)]:
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                continue
+            self.stats["evictions"] += 1
+        self._disk_entries = min(len(entries), self.max_disk_entries)
+
+    def get(self, key: str) -> Optional[types.CallToolResult]:
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry and now - entry[0] < self.ttl:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return types.CallToolResult.model_validate(entry[1])
+
+        entry = self._read_disk(key)
+        if entry and now - entry[0] < self.ttl:
+            self._remember(key, entry[0], entry[1])
+            self.stats["disk_hits"] += 1
+            return types.CallToolResult.model_validate(entry[1])
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, result: types.CallToolResult) -> None:
+        if result.isError:
+            return
+        created = time.time()
+        dumped = result.model_dump(mode="json", by_alias=True, exclude_none=True)
+        self._remember(key, created, dumped)
+        try:
+            self._write_disk(key, created, dumped)
+        except OSError:
+            # the memory level still has it, a full disk only costs the next process a round trip
+            pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Hit, miss, bypass and eviction counters, plus the hit rate over all cacheable calls.
+        """
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        lookups = hits + self.stats["misses"]
+        return dict(self.stats, entries=len(self._memory), hit_rate=round(hits / lookups, 3) if lookups else 0.0)
@@ -0,0 +1,106 @@
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
+
+from mcp import ClientSession
+
+from tool_cache import ToolResultCache, tool_cache_key
+
+
+def tool_result_block(tool_use_id: str, result: Any) -> Dict[str, Any]:
+    """
+    Turn the outcome of one call_tool into the tool_result block the Messages API expects.
+    args:
+    :param tool_use_id: ID of the tool_use block the result answers.
+    :param result: The CallToolResult, or the exception the call raised.
+    """
+    if isinstance(result, BaseException):
+        return {"type": "tool_result", "tool_use_id": tool_use_id, "is_error": True,
+                "content": f"Error calling tool: {result}"}
+    content = [{"type": "text", "text": item.text} for item in result.content if getattr(item, "text", None)]
+    block = {"type": "tool_result", "tool_use_id": tool_use_id, "content": content}
+    if result.isError:
+        block["is_error"] = True
+    return block
+
+
+class ToolDispatcher:
+    """
+    Runs the tool_use blocks of one assistant message concurrently.
+
+    A message often asks for several independent tools, possibly on different
+    servers. All of them are started together with asyncio.gather, so a turn
+    takes as long as its slowest tool rather than the sum of all of them. Each
+    server gets at most max_in_flight calls at a time per replica, the rest
+    wait for a slot.
+    A failing or unknown tool becomes an is_error tool_result and does not
+    cancel the others, and the results come back in the order of the blocks.
+
+    With a ToolResultCache, calls to idempotent tools are answered from the
+    cache when the same server, tool and arguments were called before.
+    bypass_cache skips the lookup for one call and stores the fresh result.
+    """
+
+    def __init__(self, max_in_flight: int = 4, cache: Optional[ToolResultCache] = None):
+        self.max_in_flight = max_in_flight
+        self.cache = cache
+        self._semaphores: Dict[ClientSession, asyncio.Semaphore] = {}
+
+    def _semaphore(self, session: ClientSession) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(session)
+        if semaphore is None:
+            replicas = len(getattr(session, "replicas", ())) or 1
+            semaphore = self._semaphores[session] = asyncio.Semaphore(self.max_in_flight * replicas)
+        return semaphore
+
+    async def _call(self, session: Optional[ClientSession], tool_use, bypass_cache: bool = False) -> Any:
+        if session is None:
+            raise ValueError(f"No session found for tool name: {tool_use.name}")
+        key = None
+        if self.cache is not None and self.cache.cacheable(session, tool_use.name):
+            key = tool_cache_key(getattr(session, "name", ""), tool_use.name, tool_use.input)
+            if bypass_cache:
+                self.cache.stats["bypassed"] += 1
+            else:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return cached
+        async with self._semaphore(session):
+            result = await session.call_tool(tool_use.name, arguments=tool_use.input)
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+
+    def start(self, tool_use, session: Optional[ClientSession], bypass_cache: bool = False) -> "asyncio.Task":
+        """
+        Start one tool call in the background, e.g. as soon as its block finished streaming.
+        args:
+        :param tool_use: The tool_use content block.
+        :param session: The session serving the tool, None if no server has it.
+        :param bypass_cache: Call the server even if the result is cached.
+        :returns:
+         The task, hand it to collect together with the block.
+        """
+        return asyncio.create_task(self._call(session, tool_use, bypass_cache))
+
+    async def collect(self, tool_uses: List[Any], tasks: List["asyncio.Task"]) -> List[Dict[str, Any]]:
+        """
+        Wait for calls made with start.
+        :returns:
+         One tool_result block per tool_use block, in the same order.
+        """
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return [tool_result_block(tool_use.id, result) for tool_use, result in zip(tool_uses, results)]
+
+    async def dispatch(self, tool_uses: List[Any], session_for: Callable[[str], Optional[ClientSession]],
+                       bypass_cache: bool = False) -> List[Dict[str, Any]]:
+        """
+        Call every tool of an assistant message at once.
+        args:
+        :param tool_uses: The tool_use content blocks, in message order.
+        :param session_for: Returns the session serving a tool name, None if no server has it.
+        :param bypass_cache: Call the servers even for cached results.
+        :returns:
+         One tool_result block per tool_use block, in the same order.
+        """
+        tasks = [self.start(tool_use, session_for(tool_use.name), bypass_cache) for tool_use in tool_uses]
+        return await self.collect(tool_uses, tasks)
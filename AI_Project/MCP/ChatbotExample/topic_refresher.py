@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import random
+import time
+from concurrent.futures import Executor
+from typing import Awaitable, Callable, Dict, List, Optional
+
+REFRESH_STATE_FILE = "_refresh_state.json"
+
+
+class TopicRefresher:
+    """
+    Keeps stored topics current by fetching only what was published since the last refresh.
+
+    The high-water mark of a topic is the newest published date in the catalog.
+    Each refresh asks the source for papers on or after that date, newest
+    first, and merges the delta through the same store callback search_papers
+    uses. Topics are due every interval seconds with +-jitter so they do not
+    all come due together, a failing topic backs off exponentially. At most
+    workers topics refresh at once, and the source calls run on the given
+    executor behind the shared arXiv rate limit. When each topic last
+    succeeded is kept in papers/_refresh_state.json, so short-lived stdio
+    servers do not refresh everything again at every start.
+    """
+
+    def __init__(self, paper_dir: str, catalog, source, executor: Executor,
+                 store: Callable[[Dict[str, Dict[str, Dict]]], Awaitable[List[str]]],
+                 interval: float = 6 * 3600, workers: int = 2, max_results: int = 50,
+                 jitter: float = 0.1, retry_delay: float = 60, max_backoff: float = 3600):
+        self.catalog = catalog
+        self.source = source
+        self.executor = executor
+        self.store = store
+        self.interval = interval
+        self.workers = workers
+        self.max_results = max_results
+        self.jitter = jitter
+        self.retry_delay = retry_delay
+        self.max_backoff = max_backoff
+        self.state_path = os.path.join(paper_dir, REFRESH_STATE_FILE)
+
+        self._last_success: Dict[str, float] = self._load_state()
+        self._next_due: Dict[str, float] = {}
+        self._failures: Dict[str, int] = {}
+        self.stats = {"runs": 0, "errors": 0, "fetched_papers": 0}
+
+    def _load_state(self) -> Dict[str, float]:
+        try:
+            with open(self.state_path, "r") as state_file:
+                return json.load(state_file)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return {}
+
+    def _save_state(self) -> None:
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as state_file:
+            json.dump(self._last_success, state_file)
+        os.replace(tmp_path, self.state_path)
+
+    def _jittered(self, delay: float) -> float:
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _schedule_new_topics(self, topics: List[str], now: float) -> None:
+        for key in topics:
+            if key in self._next_due:
+                continue
+            last = self._last_success.get(key)
+            if last is None:
+                # never refreshed: spread the first round over one interval
+                self._next_due[key] = now + random.uniform(0, self.interval)
+            else:
+                self._next_due[key] = last + self._jittered(self.interval)
+
+    async def refresh_topic(self, key: str, name: Optional[str] = None) -> int:
+        """
+        Fetch and store the papers of one topic that are newer than its high-water mark.
+        args:
+        :param key: The storage key of the topic.
+        :param name: Its display name, looked up in the catalog if not given.
+        :returns: The number of papers the source returned.
+        """
+        loop = asyncio.get_running_loop()
+        if name is None:
+            names = await loop.run_in_executor(self.executor, self.catalog.topic_display_names)
+            name = names.get(key, key)
+        since = await loop.run_in_executor(self.executor, self.catalog.newest_published, key)
+        # the key is stemmed ("time_sery"), arXiv is asked for the name the topic was searched under
+        found = await loop.run_in_executor(
+            self.executor, self.source.fetch_newer, name.replace("_", " "), since, self.max_results
+        )
+        if found:
+            await self.store({key: found})
+        return len(found)
+
+    async def _run_topic(self, key: str, name: str, semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            self.stats["runs"] += 1
+            try:
+                self.stats["fetched_papers"] += await self.refresh_topic(key, name)
+            except Exception:
+                self.stats["errors"] += 1
+                failures = self._failures[key] = self._failures.get(key, 0) + 1
+                backoff = min(self.max_backoff, self.retry_delay * 2 ** (failures - 1))
+                self._next_due[key] = time.time() + self._jittered(backoff)
+                return
+            self._failures.pop(key, None)
+            now = time.time()
+            self._last_success[key] = now
+            self._next_due[key] = now + self._jittered(self.interval)
+
+    async def run_once(self) -> int:
+        """
+        Refresh every topic that is due.
+        :returns: The number of topics refreshed.
+        """
+        loop = asyncio.get_running_loop()
+        topics = await loop.run_in_executor(self.executor, self.catalog.list_topics)
+        now = time.time()
+        self._schedule_new_topics(topics, now)
+        due = [key for key in topics if self._next_due[key] <= now]
+        if due:
+            names = await loop.run_in_executor(self.executor, self.catalog.topic_display_names)
+            semaphore = asyncio.Semaphore(self.workers)
+            await asyncio.gather(*(self._run_topic(key, names.get(key, key), semaphore) for key in due))
+            await loop.run_in_executor(self.executor, self._save_state)
+        return len(due)
+
+    def seconds_until_due(self, now: Optional[float] = None) -> float:
+        if not self._next_due:
+            return self.interval
+        return max(0.0, min(self._next_due.values()) - (now or time.time()))
+
+    async def run_forever(self, poll: float = 60) -> None:
+        """
+        Refresh due topics until cancelled, checking for new topics at least every poll seconds.
+        """
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                # listing the topics failed, try again at the next poll
+                pass
+            await asyncio.sleep(min(poll, self.seconds_until_due()))